@@ -0,0 +1,178 @@
+"""
+In-process stand-in for the Vault KV v2 HTTP API, for benchmarks.
+
+Serves list, data and metadata of a KV v2 mount, token lookup-self and
+renew-self, and approle login. Latency and errors (429/503 with
+Retry-After) can be injected, and every request is counted by operation.
+"""
+import collections
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+TOKEN = "bench-token"
+
+
+class FakeVault:
+    def __init__(self, mount: str = "kv", latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, retry_after: int = 0, ttl: int = 3600, seed: int = 0):
+        self.mount = mount
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.ttl = ttl
+        self.secrets = {}
+        self._index = None
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = None
+
+    def put(self, path: str, data: dict, custom_metadata: dict|None = None, version: int = 1):
+        self.secrets[path.strip('/')] = {"data": data, "custom_metadata": custom_metadata, "version": version}
+        self._index = None
+
+    def children(self, path: str) -> list:
+        # Folder index built once after the last put: listing stays O(1) on big trees
+        index = self._index
+        if index is None:
+            index = {}
+            for p in self.secrets:
+                parts = p.split('/')
+                for i in range(len(parts)):
+                    key = parts[i] + ('/' if i < len(parts) - 1 else '')
+                    index.setdefault('/'.join(parts[:i]), set()).add(key)
+            index = self._index = {k: sorted(v) for k, v in index.items()}
+        return index.get(path.strip('/'), [])
+
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts.clear()
+
+    def _delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _count(self, op: str):
+        with self._lock:
+            self.counts[op] += 1
+
+    def _secret_metadata(self, secret: dict) -> dict:
+        return {
+            "current_version": secret["version"],
+            "custom_metadata": secret["custom_metadata"],
+            "versions": {str(secret["version"]): {
+                "created_time": "2024-01-01T00:00:00Z", "deletion_time": "", "destroyed": False}},
+        }
+
+    def route(self, method: str, url: str, token: str|None) -> tuple:
+        # Return (status, body, headers) of one request
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        path = parts.path
+        if method == "GET" and query.get("list") == ["true"]:
+            method = "LIST"
+
+        if path.startswith("/v1/auth/") and path.endswith("/login"):
+            self._count("auth")
+            return 200, {"auth": {"client_token": TOKEN, "lease_duration": self.ttl,
+                                  "renewable": True, "accessor": "bench"}}, {}
+        if path == "/v1/auth/token/lookup-self":
+            self._count("auth")
+            if token != TOKEN:
+                return 403, {"errors": ["permission denied"]}, {}
+            return 200, {"data": {"ttl": self.ttl, "renewable": True, "accessor": "bench"}}, {}
+        if path == "/v1/auth/token/renew-self":
+            self._count("auth")
+            return 200, {"auth": {"client_token": TOKEN, "lease_duration": self.ttl, "renewable": True}}, {}
+
+        prefix = f"/v1/{self.mount}/"
+        if not path.startswith(prefix):
+            return 404, {"errors": []}, {}
+        kind, _, spath = path[len(prefix):].partition('/')
+        spath = spath.strip('/')
+        if kind == "metadata" and method == "LIST":
+            self._count("list")
+        else:
+            self._count("read" if kind == "data" else kind)
+        if token != TOKEN:
+            return 403, {"errors": ["permission denied"]}, {}
+        if self._fail():
+            status = self._random.choice((429, 503))
+            return status, {"errors": ["injected"]}, {"Retry-After": str(self.retry_after)}
+
+        if kind == "metadata" and method == "LIST":
+            keys = self.children(spath)
+            return (200, {"data": {"keys": keys}}, {}) if keys else (404, {"errors": []}, {})
+        secret = self.secrets.get(spath)
+        if secret is None:
+            return 404, {"errors": []}, {}
+        if kind == "data":
+            return 200, {"data": {"data": secret["data"], "metadata": {
+                "version": secret["version"], "created_time": "2024-01-01T00:00:00Z",
+                "custom_metadata": secret["custom_metadata"], "deletion_time": "", "destroyed": False}}}, {}
+        if kind == "metadata":
+            return 200, {"data": self._secret_metadata(secret)}, {}
+        return 404, {"errors": []}, {}
+
+    def _handler(self):
+        vault = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # One write per response: no Nagle / delayed ACK stalls
+            disable_nagle_algorithm = True
+            wbufsize = 64 * 1024
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                delay = vault._delay()
+                if delay:
+                    time.sleep(delay)
+                status, body, headers = vault.route(method, self.path, self.headers.get("X-Vault-Token"))
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def do_PUT(self):
+                self._serve("PUT")
+
+            def do_LIST(self):
+                self._serve("LIST")
+
+        return Handler
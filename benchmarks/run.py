@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of a sync through climain, against a local fake Vault.
+
+Each run is a fresh process: the first one installs the whole tree (cold),
+the next ones find it up to date (steady state). For every run: wall time,
+Vault requests by operation, read/write syscalls, CPU time and peak RSS.
+
+    python benchmarks/run.py --width 8 --depth 2 --alias-density 0.2 \\
+        --mix base64:6,envfile:3,x509:1 --latency-ms 5 --backend hvac --concurrency 8
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+CONF_ENVVAR = "VSG_BENCH_CONF"
+
+
+def read_proc_io() -> dict:
+    # Linux only: read/write class syscalls of this process
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def child(args) -> None:
+    # One sync in this process, measurements written to args.result
+    sys.path.insert(0, SRC)
+    from vault_secrets_getter.main import climain
+
+    cli = argparse.Namespace(loggerconf="none", config=CONF_ENVVAR, config_type="ENVVAR",
+                             secret_path=[args.path], localdir_secret=[args.localdir], manifest=None)
+    io_before = read_proc_io()
+    start = time.perf_counter()
+    try:
+        climain(cli)
+        code = 0
+    except SystemExit as e:
+        code = e.code
+    wall = time.perf_counter() - start
+    io_after = read_proc_io()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    result = {
+        "exit": code,
+        "wall_s": wall,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_kb": usage.ru_maxrss,
+        "syscalls_rw": (io_after.get("syscr", 0) + io_after.get("syscw", 0)
+                        - io_before.get("syscr", 0) - io_before.get("syscw", 0)) if io_after else None,
+        "ctx_switches": usage.ru_nvcsw + usage.ru_nivcsw,
+    }
+    with open(args.result, "w") as f:
+        json.dump(result, f)
+
+
+def write_config(filepath: str, url: str, args) -> None:
+    conf = {
+        "VAULT_ADDRESS": url,
+        "VAULT_BACKEND": args.backend,
+        "VAULT_CONCURRENCY": args.concurrency,
+        "VAULT_ASYNC_CONCURRENCY": max(args.concurrency, 1),
+        "VAULT_VERSION_GATED": args.version_gated,
+        "VAULT_LISTING_TTL": args.listing_ttl,
+        "VAULT_RETRY_BACKOFF": 0.01,
+        "SECRET_FSYNC": args.fsync,
+    }
+    if args.auth == "approle":
+        conf.update(VAULT_ROLE_ID="bench", VAULT_SECRET_ID="bench")
+        if args.token_cache:
+            conf.update(VAULT_TOKEN_CACHE=os.path.join(os.path.dirname(filepath), "token"))
+    else:
+        from fakevault import TOKEN
+        conf.update(VAULT_TOKEN=TOKEN)
+    with open(filepath, "w") as f:
+        for k, v in conf.items():
+            f.write(f"{k} = {v!r}\n")
+
+
+def bench(args) -> list:
+    from fakevault import FakeVault
+    from tree import generate
+
+    vault = FakeVault(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      error_rate=args.error_rate, seed=args.seed)
+    kinds = generate(vault, root=args.path, width=args.width, depth=args.depth,
+                     alias_density=args.alias_density, mix=args.mix, size=args.size, seed=args.seed)
+    url = vault.start()
+    workdir = tempfile.mkdtemp(prefix="vsg-bench-")
+    results = []
+    try:
+        conf = os.path.join(workdir, "config.py")
+        write_config(conf, url, args)
+        env = dict(os.environ, PWD=workdir, **{CONF_ENVVAR: conf})
+        localdir = os.path.join(workdir, "secrets")
+        resultfile = os.path.join(workdir, "result.json")
+        for run in range(args.runs):
+            vault.reset_counts()
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child",
+                            "--path", args.path, "--localdir", localdir, "--result", resultfile],
+                           env=env, check=True,
+                           stdout=None if args.verbose else subprocess.DEVNULL,
+                           stderr=None if args.verbose else subprocess.DEVNULL)
+            with open(resultfile) as f:
+                result = json.load(f)
+            result.update(
+                run="cold" if run == 0 else "warm",
+                process_s=time.perf_counter() - start,
+                requests=sum(vault.counts.values()),
+                requests_by_op=dict(vault.counts),
+            )
+            results.append(result)
+    finally:
+        vault.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(f"tree: {sum(kinds.values())} secrets {kinds}", file=sys.stderr)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark a sync against a fake Vault KV v2 server")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--localdir", help=argparse.SUPPRESS)
+    parser.add_argument("--path", default="bench", help="root of the generated tree")
+    # Tree
+    parser.add_argument("--width", type=int, default=4, help="folders per level, secrets per leaf folder")
+    parser.add_argument("--depth", type=int, default=3, help="levels of folders")
+    parser.add_argument("--alias-density", type=float, default=0.0, help="share of secrets that are aliases")
+    parser.add_argument("--mix", default="base64:6,envfile:3,x509:1", help="weighted installer types")
+    parser.add_argument("--size", type=int, default=256, help="bytes of random data per secret")
+    parser.add_argument("--seed", type=int, default=0)
+    # Server
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency added to each request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random +/- latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered 429/503")
+    parser.add_argument("--auth", choices=["token", "approle"], default="token")
+    parser.add_argument("--token-cache", action="store_true", help="reuse the approle token across runs")
+    # Client
+    parser.add_argument("--backend", choices=["hvac", "async"], default="hvac")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--version-gated", action="store_true")
+    parser.add_argument("--listing-ttl", type=int, default=0)
+    parser.add_argument("--fsync", choices=["never", "file", "always"], default="file")
+    # Harness
+    parser.add_argument("--runs", type=int, default=2, help="first run is cold, next ones are warm")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the syncs")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return 0
+
+    results = bench(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'run':<5} {'wall s':>8} {'process s':>10} {'cpu s':>7} {'requests':>9} {'rw syscalls':>12} {'peak RSS kB':>12}")
+    for r in results:
+        print(f"{r['run']:<5} {r['wall_s']:>8.3f} {r['process_s']:>10.3f} {r['cpu_s']:>7.3f} "
+              f"{r['requests']:>9} {r['syscalls_rw'] if r['syscalls_rw'] is not None else '-':>12} {r['peak_rss_kb']:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
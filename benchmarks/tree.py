@@ -0,0 +1,79 @@
+"""
+Generated secret trees for benchmarks.
+
+A tree has `depth` levels of `width` folders, with `width` secrets in each
+deepest folder. A share of the secrets (alias_density) are aliases to a
+few shared secrets, the others are installers picked from a weighted mix,
+e.g. "base64:6,envfile:3,x509:1".
+"""
+import base64
+import json
+import random
+
+PERMS = json.dumps({"perms": "0o600"})
+# secretType of installers without an INSTALLER_ALIAS entry
+SECRET_TYPES = {
+    "base16": ".SecretInstaller.base.base16",
+    "base32": ".SecretInstaller.base.base32",
+}
+ENCODERS = {
+    "base16": base64.b16encode,
+    "base32": base64.b32encode,
+    "base64": base64.b64encode,
+}
+
+
+def parse_mix(mix: str) -> list:
+    # "base64:6,envfile:3" -> [("base64", 6.0), ("envfile", 3.0)]
+    ret = []
+    for item in mix.split(','):
+        name, _, weight = item.partition(':')
+        ret.append((name.strip(), float(weight or 1)))
+    return ret
+
+
+def secret(kind: str, rnd: random.Random, size: int) -> tuple:
+    # (data, custom_metadata) of one secret of an installer type
+    meta = {"secretType": SECRET_TYPES.get(kind, kind), "secretFilename": "secret", "secretPerms": PERMS}
+    if kind in ENCODERS:
+        meta["secretBinary"] = "1"
+        return {"value": ENCODERS[kind](rnd.randbytes(size)).decode()}, meta
+    if kind == "envfile":
+        return {f"VAR{i}": rnd.randbytes(size // 8 + 1).hex() for i in range(8)}, meta
+    if kind == "x509":
+        pem = base64.encodebytes(rnd.randbytes(size)).decode()
+        return {k: f"-----BEGIN {k.upper()}-----\n{pem}-----END {k.upper()}-----\n"
+                for k in ("cert", "chain", "fullchain", "key")}, meta
+    raise ValueError(f"Unknown installer type {kind}")
+
+
+def generate(vault, root: str = "bench", width: int = 4, depth: int = 3,
+             alias_density: float = 0.0, mix: str = "base64", shared: int = 4,
+             size: int = 256, seed: int = 0) -> dict:
+    # Fill a FakeVault, return the number of secrets of each kind
+    rnd = random.Random(seed)
+    kinds = parse_mix(mix)
+    names = [k for k, w in kinds]
+    weights = [w for k, w in kinds]
+    counts = {}
+
+    # Targets of aliases, outside of the synced tree
+    shared_root = f"{root}-shared"
+    for i in range(shared):
+        kind = rnd.choices(names, weights)[0]
+        vault.put(f"{shared_root}/s{i}", *secret(kind, rnd, size))
+
+    folders = [root]
+    for _ in range(depth):
+        folders = [f"{folder}/d{i}" for folder in folders for i in range(width)]
+    for folder in folders:
+        for i in range(width):
+            if rnd.random() < alias_density:
+                kind = "alias"
+                vault.put(f"{folder}/s{i}", {"link": f"{shared_root}/s{rnd.randrange(shared)}"},
+                          {"secretType": "alias"})
+            else:
+                kind = rnd.choices(names, weights)[0]
+                vault.put(f"{folder}/s{i}", *secret(kind, rnd, size))
+            counts[kind] = counts.get(kind, 0) + 1
+    return counts
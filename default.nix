@@ -8,7 +8,6 @@ pkgs.python3Packages.callPackage (
 , pylibacl
 , hvac
 , wrapt
-, structlog
 , requests
 }:
 
@@ -25,7 +24,6 @@ buildPythonPackage rec {
     pylibacl
     hvac
     wrapt
-    structlog
   ];
   nativeCheckInputs = [
     pytestCheckHook
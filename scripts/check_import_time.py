@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Import-time regression check of the CLI entry point.
+
+Fail when importing vault_secrets_getter.main takes more than the budget
+(best of several runs of `python -X importtime`), or when it pulls in a
+module that should only be imported once a sync actually starts.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+MODULE = "vault_secrets_getter.main"
+# Imported on demand: Vault clients, ACL support and the event loop
+DEFERRED = ["hvac", "requests", "urllib3", "httpx", "posix1e", "asyncio", "wrapt"]
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (SRC, env.get("PYTHONPATH")) if p)
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_time_us() -> int:
+    # Cumulative import time of MODULE, in microseconds
+    stderr = python("-X", "importtime", "-c", f"import {MODULE}").stderr
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == MODULE:
+            return int(fields[1])
+    raise RuntimeError(f"No import time reported for {MODULE}")
+
+
+def loaded_deferred() -> list:
+    code = f"import sys, {MODULE}; print(' '.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    return python("-c", code).stdout.split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100, help="maximum import time of the CLI")
+    parser.add_argument("--runs", type=int, default=5, help="keep the best of this many runs")
+    args = parser.parse_args()
+
+    ret = 0
+    loaded = loaded_deferred()
+    if loaded:
+        print(f"{MODULE} imports {', '.join(loaded)} at startup")
+        ret = 1
+
+    best = min(import_time_us() for _ in range(args.runs)) / 1000
+    print(f"import {MODULE}: {best:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if best > args.budget_ms:
+        ret = 1
+    return ret
+
+
+if __name__ == "__main__":
+    sys.exit(main())
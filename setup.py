@@ -10,9 +10,12 @@ setup(
 #        exclude=['mypackage.tests'],  # empty by default
     ),
     package_dir={"": "src"}, 
+    extras_require={
+        'async': ['httpx[http2]'],
+    },
     entry_points={
         'console_scripts': [
-            'vault-secrets-getter = vault_secrets_getter:main',
+            'vault-secrets-getter = vault_secrets_getter.main:main',
         ],
     }
 )
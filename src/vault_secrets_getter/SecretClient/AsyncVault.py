@@ -0,0 +1,291 @@
+import asyncio
+import importlib.util
+import time
+
+import httpx
+import hvac.utils
+
+from .Secrets import SecretGetter, AsyncSecret, gather_or_cancel
+from ..lib.metrics import METRICS, record_request
+from .limiter import AsyncLimiter, parse_retry_after, retry_delay
+from .tokencache import TokenCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+# 429, 502 and 503: Vault is overloaded, back off and retry
+RETRYABLE_STATUS = (429, 502, 503)
+
+def get_async_vault_client(vault_url, certs, max_connections=100, timeout=30):
+        """
+        Instantiates an asyncio http client for the vault service.
+        :param vault_url: string, protocol + address + port for the vault service
+        :param certs: string, Optional CA bundle to use for verification
+        :param max_connections: int, Size of the keep-alive connection pool
+        :param timeout: int, seconds before a request times out
+        :return: httpx.AsyncClient
+        """
+        logger.debug('Retrieving a vault (httpx) async client...')
+        # HTTP/2 multiplexes all requests over one connection, but needs h2
+        http2 = importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+                base_url=vault_url,
+                verify=certs or True,
+                http2=http2,
+                timeout=timeout,
+                limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                ),
+        )
+
+class AsyncVaultClient(SecretGetter):
+    # Same contract as VaultClient, but _get, _gets and get are coroutines
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _conf(self, args, kwargs):
+        super()._conf(args, kwargs)
+        self._config = kwargs.get("config")
+        concurrency = int(self._config.get("VAULT_ASYNC_CONCURRENCY") or 1)
+        self._http = get_async_vault_client(
+             self._config["VAULT_ADDRESS"],
+             self._config["VAULT_CA"],
+             max_connections=concurrency,
+             timeout=self._config.get("VAULT_TIMEOUT") or 30
+        )
+        self._token = self._config["VAULT_TOKEN"]
+        self._authenticated = False
+        self._token_refresh = None
+        self._auth_lock = asyncio.Lock()
+        self._limiter = AsyncLimiter(
+             concurrency,
+             minimum=self._config.get("VAULT_MIN_CONCURRENCY") or 1,
+             target_latency=self._config.get("VAULT_TARGET_LATENCY") or 0.5
+        )
+        # Negative cache: (operation, path) already known to be missing
+        self._missing = set()
+        # Token of the approle / JWT login shared with the next runs
+        self._token_cache = TokenCache.from_config(self._config)
+        self._token_key = TokenCache.key_of(self._config) if self._token_cache else None
+        self._token_cached = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _login(self, mount_point: str, payload: dict):
+        resp = await self._request("POST", f"/v1/auth/{mount_point}/login", json=payload, auth=False)
+        METRICS.inc("vault_logins_total")
+        self._token = resp["auth"]["client_token"]
+        self._token_cached = False
+        ttl = resp["auth"].get("lease_duration") or 0
+        self._set_token_ttl(ttl)
+        if self._token_key is not None:
+            self._token_cache.set(self._token_key, self._token, ttl,
+                                  resp["auth"].get("renewable", False), resp["auth"].get("accessor"))
+
+    def _set_token_ttl(self, ttl: float):
+        self._token_refresh = None
+        if ttl:
+            # Login again once the token is close to its expiry
+            margin = min(self._config.get("VAULT_TOKEN_RENEW_MARGIN") or 0, ttl / 2)
+            self._token_refresh = time.monotonic() + ttl - margin
+
+    def _cached_token(self) -> bool:
+        # Token of an earlier run, until it is close to its expiry
+        if self._token_key is None:
+            return False
+        entry = self._token_cache.get(self._token_key)
+        if entry is None:
+            return False
+        self._token = entry["token"]
+        self._token_cached = True
+        self._set_token_ttl(entry["expires"] - time.time() if entry.get("expires") is not None else 0)
+        logger.debug("Vault token from cache")
+        METRICS.inc("token_cache_hits_total")
+        return True
+
+    async def _auth(self, cached: bool = True):
+        if cached and self._cached_token():
+            self._authenticated = True
+            return
+
+        if self._config.get("VAULT_ROLE_ID") and self._config.get("VAULT_SECRET_ID"):
+            await self._login(self._config["VAULT_AUTHPATH"] or 'approle', {
+                "role_id": self._config["VAULT_ROLE_ID"],
+                "secret_id": self._config["VAULT_SECRET_ID"],
+            })
+
+        if self._config.get("VAULT_JWT_ROLE") and self._config.get("VAULT_JWT_KEY"):
+            await self._login(self._config["VAULT_AUTHPATH"] or 'jwt', {
+                "role": self._config["VAULT_JWT_ROLE"],
+                "jwt": self._config["VAULT_JWT_KEY"],
+            })
+
+        if not self._token:
+            raise Exception('Not authenticated')
+        self._authenticated = True
+
+    def reset(self):
+        super().reset()
+        self._missing.clear()
+
+    def token_refresh_delay(self) -> float|None:
+        if self._token_refresh is None:
+            return None
+        return max(0, self._token_refresh - time.monotonic())
+
+    def _token_fresh(self) -> bool:
+        return self._authenticated and (
+            self._token_refresh is None or time.monotonic() < self._token_refresh)
+
+    async def _ensure_auth(self):
+        if self._token_fresh():
+            return
+        async with self._auth_lock:
+            if not self._token_fresh():
+                # Cached token only for the first login of the run
+                await self._auth(cached=not self._authenticated)
+
+    async def _revalidate(self, token: str):
+        # A cached token got 403: login again if it was revoked,
+        # keep it if access to the path is denied
+        async with self._auth_lock:
+            if self._token != token or not self._token_cached:
+                return
+            resp = await self._send("GET", "/v1/auth/token/lookup-self", headers={"X-Vault-Token": token})
+            if resp.status_code == 200:
+                self._token_cached = False
+                return
+            logger.info("Cached Vault token rejected, login again")
+            self._token_cache.discard(self._token_key)
+            await self._auth(cached=False)
+
+    async def _send(self, method: str, url: str, **kwargs):
+        # Send under the concurrency limiter, retry on overload
+        retries = self._config.get("VAULT_RETRIES") or 0
+        attempt = 0
+        while True:
+            await self._limiter.acquire()
+            start = time.monotonic()
+            retry_after = None
+            try:
+                resp = await self._http.request(method, url, **kwargs)
+                record_request(method, str(resp.url), time.monotonic() - start, len(resp.content))
+            except httpx.TransportError as e:
+                await self._limiter.release(overloaded=True)
+                if attempt >= retries:
+                    raise
+                reason = e.__class__.__name__
+            else:
+                if resp.status_code not in RETRYABLE_STATUS or attempt >= retries:
+                    await self._limiter.release(time.monotonic() - start,
+                                                overloaded=resp.status_code in RETRYABLE_STATUS)
+                    return resp
+                await self._limiter.release(overloaded=True)
+                reason = f"HTTP {resp.status_code}"
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            delay = retry_delay(
+                attempt,
+                retry_after,
+                base=self._config.get("VAULT_RETRY_BACKOFF") or 0.5,
+                cap=self._config.get("VAULT_RETRY_MAX_DELAY") or 30
+            )
+            logger.info(f"Vault overloaded ({reason}), retry in {delay:.2f}s")
+            METRICS.inc("vault_retries_total")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _request(self, method: str, url: str, auth: bool = True, **kwargs):
+        # Return decoded JSON, None on 404, raise hvac exceptions otherwise
+        headers = {}
+        if auth:
+            await self._ensure_auth()
+            headers["X-Vault-Token"] = self._token
+        resp = await self._send(method, url, headers=headers, **kwargs)
+        if resp.status_code == 403 and auth and self._token_cached:
+            await self._revalidate(headers["X-Vault-Token"])
+            if self._token != headers["X-Vault-Token"]:
+                headers["X-Vault-Token"] = self._token
+                resp = await self._send(method, url, headers=headers, **kwargs)
+        if resp.status_code == 404:
+            return None
+        if resp.status_code >= 400:
+            try:
+                errors = resp.json().get("errors")
+            except ValueError:
+                errors = None
+            hvac.utils.raise_for_error(method, url, resp.status_code,
+                                       errors=errors, text=resp.text)
+        return resp.json()
+
+    async def _get(self, path: str, dir: str ="/", pmeta:dict|None = None):
+        secret, meta = await gather_or_cancel(
+            self._get_data(path, dir=dir, pmeta=pmeta),
+            self._get_meta(path, dir, pmeta),
+        )
+        if len(secret) == 0 or len(meta) == 0:
+            return {}
+        secret.update(meta)
+        return secret
+
+    async def _get_meta(self, path: str, dir: str ="/", pmeta:dict|None = None):
+        mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
+        path = path.strip('/')
+        if ("metadata", path) in self._missing:
+            return {}
+        mresp = await self._request("GET", f"/v1/{mount_point}/metadata/{path}")
+        if mresp is None:
+            logger.debug(f"{path} has no secret")
+            self._missing.add(("metadata", path))
+            return {}
+        try:
+            return {"metadata": mresp["data"]}
+        except KeyError as e:
+            logger.debug(f"_get_meta return keyerror: {e!s}")
+            return {}
+
+    async def _get_data(self, path: str, version: int|None = None, dir: str ="/", pmeta:dict|None = None):
+        mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
+        path = path.strip('/')
+        if ("data", path) in self._missing:
+            return {}
+        params = {"version": version} if version is not None else None
+        resp = await self._request("GET", f"/v1/{mount_point}/data/{path}", params=params)
+        if resp is None:
+            logger.debug(f"{path} has no secret")
+            if version is None:
+                self._missing.add(("data", path))
+            return {}
+        try:
+            return {"secret": resp["data"]}
+        except KeyError as e:
+            logger.debug(f"_get_data return keyerror: {e!s}")
+            return {}
+
+    async def _gets(self, path: str, dir: str ="/", pmeta:dict|None = None):
+        mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
+        if path[-1] == '/':
+             path = path[:-1]
+        if ("list", path) in self._missing:
+            return []
+        resp = await self._request("LIST", f"/v1/{mount_point}/metadata/{path}")
+        if resp is None:
+            logger.debug(f"{path} is not a directory")
+            self._missing.add(("list", path))
+            return []
+        try:
+            return [ (k, f"{path}/{k}") for k in resp["data"]["keys"]]
+        except KeyError as e:
+            logger.debug(f"gets return keyerror: {e!s}")
+            return []
+
+
+class AsyncVaultSecret(AsyncSecret, AsyncVaultClient):
+    pass
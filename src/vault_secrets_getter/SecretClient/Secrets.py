@@ -1,11 +1,114 @@
-
-import structlog
+import asyncio
+import copy
+import queue
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Kind of a tree node, known from the listing of its parent (folders end with '/')
+# None means unknown (root of a walk or alias target): probe it as both
+NODE_LEAF = "leaf"
+NODE_DIR = "dir"
+
+# Longest alias chain followed, guard against runaway alias trees
+MAX_ALIAS_DEPTH = 32
+
+def node_kind(sub: str) -> str:
+    return NODE_DIR if sub.endswith('/') else NODE_LEAF
+
+async def gather_or_cancel(*aws):
+    # asyncio.gather, but when one awaitable raises the others are cancelled
+    # and awaited: no task of a failed walk is left on the (reused) loop
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
 from ..lib.loader import LoaderFiltered
-from ..SecretInstaller.base import MissingSecretInstaller
+from ..lib.registry import InstallerRegistry
+from ..lib.decorators.memoize import MemoizeCache
+from ..lib.metrics import METRICS
+from ..SecretInstaller.base import MissingSecretInstaller, SecretInstaller
+from ..SecretInstaller.state import StateIndex
+from .listing import ListingIndex
+
+
+class _StreamClosed(Exception):
+    pass
+
+
+class SecretStream:
+    """
+    Installers of one walk, iterated while the walk goes on.
+
+    The walk runs in a producer thread and hands each installer over a
+    bounded queue as soon as its secret is fetched: installing overlaps
+    fetching, and the walk waits while buffer installers are not taken.
+    Once exhausted, keys lists the installers in the order get_into would
+    have returned them.
+    """
+    _DONE = object()
+
+    def __init__(self, walk, buffer: int = 0):
+        # walk(sink): run the walk, calling sink(key, installer), return its result
+        self.keys = []
+        self._walk = walk
+        self._queue = queue.Queue(maxsize=buffer)
+        self._stopped = threading.Event()
+        self._thread = None
+        self._done = False
+
+    def _sink(self, key: str, installer):
+        if self._stopped.is_set():
+            raise _StreamClosed()
+        self._queue.put((key, installer))
+
+    def _produce(self):
+        error = None
+        try:
+            self.keys = list(self._walk(self._sink))
+        except BaseException as e:
+            error = e
+        self._queue.put((self._DONE, error))
+
+    def start(self) -> None:
+        # Start the walk before iterating: it fetches up to buffer installers ahead
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._produce, name="vault-stream", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        # Wait for the producer, aborting the walk if it is not exhausted
+        if self._thread is None:
+            return
+        if not self._done:
+            # Consumer stopped early: abort the walk, unblock the producer
+            self._stopped.set()
+            while self._queue.get()[0] is not self._DONE:
+                pass
+            self._done = True
+        self._thread.join()
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                key, value = self._queue.get()
+                if key is self._DONE:
+                    self._done = True
+                    if value is not None:
+                        raise value
+                    return
+                yield key, value
+        finally:
+            self.close()
 
 
 class SecretGetter:
@@ -16,10 +119,34 @@ class SecretGetter:
     def _conf(self, args, kwargs):
         self._config = kwargs.get("config")
 
+    def reset(self):
+        # Forget per-run caches once a sync is over
+        pass
+
+    def token_refresh_delay(self) -> float|None:
+        # Seconds before the credentials must be renewed, None if never
+        return None
+
+    def connection_stats(self) -> dict:
+        # Requests sent / connections opened, if the backend tracks them
+        return {}
+
+    def cache_stats(self) -> dict:
+        # Hits, misses, evictions and size of the client caches, by cache
+        return {}
+
     def _get(self, path: str, dir: str ="/", pmeta:dict|None = None):
         # Should return {secret: Dict, metadata: Dict}
         raise NotImplementedError()
     
+    def _get_meta(self, path: str, dir: str ="/", pmeta:dict|None = None):
+        # Should return {metadata: Dict}
+        raise NotImplementedError()
+
+    def _get_data(self, path: str, version: int|None = None, dir: str ="/", pmeta:dict|None = None):
+        # Should return {secret: Dict} of the given version (latest if None)
+        raise NotImplementedError()
+
     def _gets(self, path: str, dir: str="/", pmeta:dict|None = None):
         # Should return list of (sub, subpath)
         raise NotImplementedError()
@@ -33,15 +160,283 @@ class Secret(SecretGetter):
     # Get Secret Installer for each path and following aliases
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._loader = LoaderFiltered(
+        # Installer class of each secret type, resolved once per type
+        self._loader = InstallerRegistry(LoaderFiltered(
             alias = self._config["INSTALLER_ALIAS"],
             filters = self._config["INSTALLER_FILTER"], 
-            package = "vault_secrets_getter")
+            package = "vault_secrets_getter"))
+        # Local base dir of the installers (None: SECRET_BASE_DIR)
+        self._base = None
+        # State indexes by file, may be shared with the clients of other sources
+        self._states = kwargs.get("states", {})
+        # Name of the source in shared listing indexes ("": single source)
+        self._scope = kwargs.get("scope", "")
+        # Backend reads of the current run: a path shared by many aliases
+        # (or sync entries) is read once
+        self._fetched = MemoizeCache(maxsize=self._config.get("VAULT_RUN_CACHE_SIZE") or None)
+        # Streaming walk: called with each installer as soon as it is fetched
+        self._sink = None
+        # Plan mode: walk with metadata only, see plan_into
+        self._planning = False
+
+    def reset(self):
+        super().reset()
+        self._fetched.clear()
+
+    def cache_stats(self) -> dict:
+        stats = super().cache_stats()
+        stats["run"] = self._fetched.stats()
+        stats.update(self._loader.cache_stats())
+        return stats
+
+    def _once(self, key: tuple, fetch):
+        # Copy: callers may update the returned dict
+        return copy.copy(self._fetched.get(key, lambda: self._freeze(fetch())))
+
+    @staticmethod
+    def _freeze(ret):
+        # Custom metadata of a read is shared, read-only, by every installer
+        # (and alias target) using it: none of them needs its own copy
+        if isinstance(ret, dict):
+            for meta in (ret.get("secret", {}).get("metadata"), ret.get("metadata")):
+                if isinstance(meta, dict) and isinstance(meta.get("custom_metadata"), dict):
+                    meta["custom_metadata"] = types.MappingProxyType(meta["custom_metadata"])
+        return ret
+
+    def _state(self, base: str|None = None, index=StateIndex) -> StateIndex:
+        # One index per file, shared by all walks into it
+        filepath = index.filepath_for(self._config, base)
+        state = self._states.get(filepath)
+        if state is None:
+            state = self._states.setdefault(filepath, index(filepath))
+        return state
+
+    def _listing(self) -> ListingIndex|None:
+        # Cached folder listings of the current base dir, None if disabled
+        if not self._config.get("VAULT_LISTING_TTL"):
+            return None
+        return self._state(self._base, ListingIndex)
+
+    def _cached_gets(self, path: str):
+        listing = self._listing()
+        if listing is None:
+            return None
+        subs = listing.listing(path, self._config["VAULT_LISTING_TTL"], self._scope)
+        if subs is not None:
+            logger.debug(f"{path} listing from cache")
+            METRICS.inc("listing_cache_hits_total")
+        return subs
+
+    def _store_gets(self, path: str, subs: list):
+        listing = self._listing()
+        if listing is not None:
+            listing.store(path, subs, self._scope)
+
+    def _seen(self, path: str, ret: dict):
+        # Track the version of fetched leaves to revalidate changed folders
+        listing = self._listing()
+        if listing is None:
+            return
+        version = None
+        try:
+            if "secret" in ret:
+                version = ret["secret"]["metadata"]["version"]
+            elif "metadata" in ret:
+                version = ret["metadata"]["current_version"]
+        except KeyError:
+            pass
+        listing.seen(path, version, self._scope)
+
+    def _gets(self, path: str, dir: str="/", pmeta:dict|None = None):
+        METRICS.inc("walk_nodes_total", kind="dir")
+        subs = self._cached_gets(path)
+        if subs is None:
+            backend = super()
+            subs = self._once(("list", path.rstrip('/')), lambda: backend._gets(path, dir, pmeta))
+            self._store_gets(path, subs)
+        return subs
+
+    def commit_state(self) -> bool:
+        # Save installed versions and listings, once all installers have run
+        ret = False
+        for state in list(self._states.values()):
+            ret |= state.commit()
+        return ret
+
+    def get_into(self, path: str, base: str, sink=None):
+        # Same as get, with installers targeting the local base dir
+        # sink(key, installer): see _emit
+        self._base = base
+        self._sink = sink
+        try:
+            return self.get(path)
+        finally:
+            self._base = None
+            self._sink = None
+
+    def stream_into(self, path: str, base: str, runner=None) -> SecretStream:
+        # Installers of get_into, handed over while the walk goes on
+        # runner: resolves what get_into returns (event loop of the async backend)
+        def walk(sink):
+            ret = self.get_into(path, base, sink=sink)
+            return runner(ret) if runner is not None else ret
+        return SecretStream(walk, int(self._config.get("SECRET_PIPELINE_BUFFER") or 0))
+
+    def _emit(self, ret: dict, chain: tuple):
+        # Streaming walk: hand installers over as soon as they are fetched,
+        # under their final key (see _via), and keep only keys in the result
+        if self._sink is None or len(ret) == 0:
+            return ret
+        for k, v in ret.items():
+            self._sink(">>".join((*chain, k)), v)
+        return dict.fromkeys(ret)
+
+    def reload(self, installer) -> bool:
+        # Read again the data of a released installer, same version
+        # Return False if that version is gone
+        backend = super()
+        path = installer._path
+        version = installer._secret["secret"]["metadata"]["version"]
+        ret = self._once(("data", path, version), lambda: backend._get_data(path, version))
+        if len(ret) == 0:
+            return False
+        installer.restore(ret["secret"]["data"])
+        return True
+
+    def reload_all(self, installers: list) -> list:
+        # reload of each installer (or its exception), VAULT_CONCURRENCY at a time
+        workers = int(self._config.get("VAULT_CONCURRENCY") or 1)
+        if workers <= 1 or len(installers) <= 1:
+            ret = []
+            for installer in installers:
+                try:
+                    ret.append(self.reload(installer))
+                except Exception as e:
+                    ret.append(e)
+            return ret
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vault-reload") as pool:
+            futures = [pool.submit(self.reload, installer) for installer in installers]
+        return [fut.exception() or fut.result() for fut in futures]
+
+    def plan_into(self, path: str, base: str):
+        # Same walk as get_into, reading only metadata (and alias links):
+        # installers come without data, a secret typed in its data is a dict
+        # of its path and version (see _unknown)
+        self._planning = True
+        try:
+            return self.get_into(path, base)
+        finally:
+            self._planning = False
+
+    def stale(self, bases: list, seen: set, unknown: set = frozenset()) -> list:
+        # Entries of the state index of bases not installed by the walk
+        # unknown: Vault paths whose files can't be known (see _unknown)
+        ret = []
+        for base in bases:
+            state = self._state(base)
+            prefix = SecretInstaller.sanitize_path(base) + "/"
+            for key, entry in state.items():
+                if key.startswith(prefix) and key not in seen and entry.get("path") not in unknown:
+                    ret.append({"path": entry.get("path"), "file": key, "installed": entry.get("version")})
+        return ret
     
-    def _get(self, path: str, dir:str="/", pmeta:dict|None = None):
-        ret = super()._get(path, dir, pmeta)
+    def _fetch(self, path: str, dir:str="/", pmeta:dict|None = None):
+        # Return ({path: SecretInstaller}, None) or ({}, (npath, dir, pmeta)) for an alias
+        self._count_node(dir)
+        backend = super()
+        if not (self._planning or self._config.get("VAULT_VERSION_GATED")):
+            ret = self._once(("get", path), lambda: backend._get(path, dir, pmeta))
+            self._seen(path, ret)
+            return self._dispatch(path, dir, pmeta, ret)
+
+        # Read metadata first, secret data only if the local copy is outdated
+        mret = self._once(("metadata", path), lambda: backend._get_meta(path, dir, pmeta))
+        self._seen(path, mret)
+        installer = self._current_installer(path, dir, pmeta, mret)
+        if installer is not None:
+            return {path: installer}, None
+        if len(mret) == 0 or self._version_metadata(mret) is None:
+            return {}, None
+        if self._planning and not self._is_alias(mret):
+            # Type in the secret data: can't be planned without reading it,
+            # only its path and version are known
+            return {path: self._unknown(path, mret)}, None
+        version = mret["metadata"]["current_version"]
+        ret = self._once(("data", path, version), lambda: backend._get_data(path, version, dir, pmeta))
         if len(ret) == 0:
-            return {}
+            return {}, None
+        ret.update(mret)
+        return self._dispatch(path, dir, pmeta, ret)
+
+    @classmethod
+    def _unknown(cls, path: str, mret: dict) -> dict:
+        # Plan of a secret typed in its data (see plan_into)
+        return {"path": path, "version": cls._version_metadata(mret).get("version")}
+
+    @staticmethod
+    def _count_node(dir: str):
+        METRICS.inc("walk_nodes_total", kind="secret")
+        METRICS.max("walk_depth", dir.rstrip('/').count('/'))
+
+    @staticmethod
+    def _version_metadata(mret: dict):
+        # Build the metadata read_secret_version would return from the metadata endpoint
+        try:
+            meta = mret["metadata"]
+            version = meta["current_version"]
+            cur = meta["versions"][str(version)]
+        except KeyError:
+            return None
+        if cur.get("deletion_time") or cur.get("destroyed"):
+            # Current version deleted: same as a missing secret
+            return None
+        return {
+            "version": version,
+            "created_time": cur.get("created_time"),
+            "deletion_time": cur.get("deletion_time"),
+            "destroyed": cur.get("destroyed"),
+            "custom_metadata": meta.get("custom_metadata"),
+        }
+
+    @classmethod
+    def _is_alias(cls, mret: dict) -> bool:
+        meta = cls._version_metadata(mret)["custom_metadata"] or {}
+        return meta.get("secretType") == "alias"
+
+    def _current_installer(self, path: str, dir:str, pmeta:dict|None, mret: dict):
+        # Return the installer of a secret whose version is already installed
+        # locally, without its data. None when data must be read.
+        if len(mret) == 0:
+            return None
+        vmeta = self._version_metadata(mret)
+        if vmeta is None:
+            return None
+        meta = vmeta["custom_metadata"] or {}
+        type = meta.get("secretType")
+        if type is None or type == "alias":
+            # Type in secret data, or alias link: we need the data anyway
+            return None
+        ret = {"secret": {"data": None, "metadata": vmeta}}
+        ret.update(mret)
+        installer = self._instance(type, path, dir, pmeta, ret)
+        if self._planning:
+            return installer
+        if installer.is_current():
+            logger.debug(f"{path} is up to date, skip reading data")
+            return installer
+        return None
+
+    def _instance(self, type: str, path: str, dir:str, pmeta:dict|None, ret: dict):
+        try:
+            return self._loader.get_instance(type, dir=dir, path=path, config=self._config, secret=ret, getter=self, parentmeta=pmeta, state=self._state(self._base), base=self._base)
+        except ImportError as e:
+            logger.error(f"Cannot install returned secret of type {type} : {e!s}")
+            raise MissingSecretInstaller(type=type, secret=ret)
+
+    def _dispatch(self, path: str, dir:str, pmeta:dict|None, ret: dict):
+        # Choose the SecretInstaller of a fetched secret, or the link of an alias
+        if len(ret) == 0:
+            return {}, None
         mtype = None
         stype = None
         type = None
@@ -64,44 +459,258 @@ class Secret(SecretGetter):
                     # Maybe should be dealt as AliasSecret & Secrets for type
                     try:
                         npath = ret["secret"]["data"]["link"]
-                        ret = self.get(npath, dir=dir, pmeta=(meta or pmeta))
-                        if len(ret) == 0:
-                            logger.info(f"{path}>>{npath} : No secret found")
-                            return {}
-                        return ret
+                        return {}, (npath, dir, (meta or pmeta))
                     except KeyError as e:
                         logger.error(f"No link in secret {path} with type {type}")
-                        return {}
+                        return {}, None
                 case _:
-                    try:
-                        return {path: self._loader.get_instance(type, dir=dir, path=path, config=self._config, secret=ret, getter=self, parentmeta=pmeta)}
-                    except ImportError as e:
-                        logger.error(f"Cannot install returned secret of type {type} : {e!s}")
-                        raise MissingSecretInstaller(type=type, secret=ret)
+                    return {path: self._instance(type, path, dir, pmeta, ret)}, None
         else:
             # Use default SecretInstaller
-            try:
-                return {path: self._loader.get_instance("default", dir=dir, path=path, config=self._config, secret=ret, getter=self)}
-            except ImportError as e:
-                logger.error(f"Cannot install returned secret of type {type} : {e!s}")
-                raise MissingSecretInstaller(type="default", secret=ret)
+            return {path: self._instance("default", path, dir, None, ret)}, None
 
+    @staticmethod
+    def _follow(path: str, chain: tuple):
+        # Alias chain leading to the link target, None on a cycle
+        # chain: aliases being resolved above path
+        METRICS.inc("walk_nodes_total", kind="alias")
+        if path in chain:
+            logger.error(f"Alias cycle: {' >> '.join(chain + (path,))}")
+            return None
+        if len(chain) >= MAX_ALIAS_DEPTH:
+            logger.error(f"Alias chain longer than {MAX_ALIAS_DEPTH}: {' >> '.join(chain + (path,))}")
+            return None
+        return chain + (path,)
 
-    def get(self, path:str, dir: str = "/", pmeta:dict|None = None):
+    @staticmethod
+    def _via(path: str, ret: dict):
+        # Key installers of an alias target by alias: many aliases of the
+        # same target each keep their own installer (dir, parent metadata)
+        return {f"{path}>>{k}": v for k, v in ret.items()}
+
+    def _get(self, path: str, dir:str="/", pmeta:dict|None = None, chain: tuple = ()):
+        ret, link = self._fetch(path, dir, pmeta)
+        if link is None:
+            return self._emit(ret, chain)
+        npath, ndir, nmeta = link
+        chain = self._follow(path, chain)
+        if chain is None:
+            return {}
+        ret = self.get(npath, dir=ndir, pmeta=nmeta, chain=chain)
+        if len(ret) == 0:
+            logger.info(f"{path}>>{npath} : No secret found")
+        return self._via(path, ret)
+
+    def get(self, path:str, dir: str = "/", pmeta:dict|None = None, chain: tuple = ()):
         # Recursively return dict of SecretInstaller
+        workers = int(self._config.get("VAULT_CONCURRENCY") or 1)
+        if workers > 1:
+            return self._get_concurrent(path, dir, pmeta, workers, chain)
+        return self._get_sequential(path, dir, pmeta, chain=chain)
+
+    def _get_sequential(self, path:str, dir: str = "/", pmeta:dict|None = None, kind: str|None = None, chain: tuple = ()):
         # List all subpath and current path to search secret to install
 
         # Try to read current path as a secret
         ret = {}
+        if kind != NODE_DIR:
+            try:
+                ret = self._get(path, dir, pmeta, chain)
+            except MissingSecretInstaller:
+                logger.info(f"No installable secret in {path}")
+
+        # Try to read current path as a dir of secret
+        if kind != NODE_LEAF:
+            for (sub, subpath) in self._gets(path, dir, pmeta):
+                ret.update(self._get_sequential(subpath, dir + sub, pmeta=pmeta, kind=node_kind(sub), chain=chain))
+        
+        # Did we have some secrets ?
+        if len(ret) == 0:
+            logger.info(f"No secrets in ${path}")
+
+        # return all secret received
+        return ret
+
+    def _walk_node(self, path:str, dir: str = "/", pmeta:dict|None = None, kind: str|None = None, chain: tuple = ()):
+        # Fetch one node of the tree: its secret (or alias link) and its children
+        # The link is returned as _walk_node arguments of its target
+        ret, link, children = {}, None, []
+        if kind != NODE_DIR:
+            try:
+                ret, link = self._fetch(path, dir, pmeta)
+                ret = self._emit(ret, chain)
+            except MissingSecretInstaller:
+                logger.info(f"No installable secret in {path}")
+        if link is not None:
+            lchain = self._follow(path, chain)
+            link = None if lchain is None else (*link, None, lchain)
+        if kind != NODE_LEAF:
+            children = [(subpath, dir + sub, pmeta, node_kind(sub), chain) for (sub, subpath) in self._gets(path, dir, pmeta)]
+        return ret, link, children
+
+    def _get_concurrent(self, path:str, dir: str, pmeta:dict|None, workers: int, chain: tuple = ()):
+        # Same walk as _get_sequential, but every node (secret, alias target
+        # or subdirectory) is fetched by a bounded pool of workers.
+        nodes = {}
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vault-walk")
         try:
-            ret = self._get(path, dir, pmeta)
+            pending = {pool.submit(self._walk_node, path, dir, pmeta, None, chain): (0, path)}
+            next_id = 1
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    nid, npath = pending.pop(fut)
+                    ret, link, children = fut.result()
+                    link_id = None
+                    if link is not None:
+                        link_id = next_id
+                        next_id += 1
+                        pending[pool.submit(self._walk_node, *link)] = (link_id, link[0])
+                    child_ids = []
+                    for child in children:
+                        child_ids.append(next_id)
+                        pending[pool.submit(self._walk_node, *child)] = (next_id, child[0])
+                        next_id += 1
+                    nodes[nid] = (npath, ret, link, link_id, child_ids)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        return self._assemble(nodes, 0)
+
+    def _assemble(self, nodes: dict, nid: int):
+        # Merge node results in the order _get_sequential would have produced them
+        path, ret, link, link_id, child_ids = nodes[nid]
+        ret = dict(ret)
+        if link_id is not None:
+            ret = self._assemble(nodes, link_id)
+            if len(ret) == 0:
+                logger.info(f"{path}>>{link[0]} : No secret found")
+            ret = self._via(path, ret)
+        for child_id in child_ids:
+            ret.update(self._assemble(nodes, child_id))
+        if len(ret) == 0:
+            logger.info(f"No secrets in ${path}")
+        return ret
+
+
+class AsyncSecret(Secret):
+    # Same walk as Secret, driven with gather_or_cancel over an async SecretGetter
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Per-run reads as tasks: concurrent readers of a path await the same one
+        self._tasks = {}
+
+    def reset(self):
+        super().reset()
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def _aonce(self, key: tuple, fetch):
+        async def frozen():
+            return self._freeze(await fetch())
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(frozen())
+        return copy.copy(await task)
+
+    async def get_into(self, path: str, base: str, sink=None):
+        self._base = base
+        self._sink = sink
+        try:
+            return await self.get(path)
+        finally:
+            self._base = None
+            self._sink = None
+
+    async def reload(self, installer) -> bool:
+        backend = super(Secret, self)
+        path = installer._path
+        version = installer._secret["secret"]["metadata"]["version"]
+        ret = await self._aonce(("data", path, version), lambda: backend._get_data(path, version))
+        if len(ret) == 0:
+            return False
+        installer.restore(ret["secret"]["data"])
+        return True
+
+    async def reload_all(self, installers: list) -> list:
+        return await asyncio.gather(*(self.reload(installer) for installer in installers), return_exceptions=True)
+
+    async def plan_into(self, path: str, base: str):
+        self._planning = True
+        try:
+            return await self.get_into(path, base)
+        finally:
+            self._planning = False
+
+    async def _fetch(self, path: str, dir:str="/", pmeta:dict|None = None):
+        # Skip Secret in the MRO: the backend methods are the coroutines after it
+        self._count_node(dir)
+        backend = super(Secret, self)
+        if not (self._planning or self._config.get("VAULT_VERSION_GATED")):
+            ret = await self._aonce(("get", path), lambda: backend._get(path, dir, pmeta))
+            self._seen(path, ret)
+            return self._dispatch(path, dir, pmeta, ret)
+
+        mret = await self._aonce(("metadata", path), lambda: backend._get_meta(path, dir, pmeta))
+        self._seen(path, mret)
+        installer = self._current_installer(path, dir, pmeta, mret)
+        if installer is not None:
+            return {path: installer}, None
+        if len(mret) == 0 or self._version_metadata(mret) is None:
+            return {}, None
+        if self._planning and not self._is_alias(mret):
+            # Type in the secret data: can't be planned without reading it,
+            # only its path and version are known
+            return {path: self._unknown(path, mret)}, None
+        version = mret["metadata"]["current_version"]
+        ret = await self._aonce(("data", path, version), lambda: backend._get_data(path, version, dir, pmeta))
+        if len(ret) == 0:
+            return {}, None
+        ret.update(mret)
+        return self._dispatch(path, dir, pmeta, ret)
+
+    async def _gets(self, path: str, dir: str="/", pmeta:dict|None = None):
+        METRICS.inc("walk_nodes_total", kind="dir")
+        subs = self._cached_gets(path)
+        if subs is None:
+            backend = super(Secret, self)
+            subs = await self._aonce(("list", path.rstrip('/')), lambda: backend._gets(path, dir, pmeta))
+            self._store_gets(path, subs)
+        return subs
+
+    async def _get(self, path: str, dir:str="/", pmeta:dict|None = None, chain: tuple = ()):
+        ret, link = await self._fetch(path, dir, pmeta)
+        if link is None:
+            return self._emit(ret, chain)
+        npath, ndir, nmeta = link
+        chain = self._follow(path, chain)
+        if chain is None:
+            return {}
+        ret = await self.get(npath, dir=ndir, pmeta=nmeta, chain=chain)
+        if len(ret) == 0:
+            logger.info(f"{path}>>{npath} : No secret found")
+        return self._via(path, ret)
+
+    async def _get_installable(self, path: str, dir:str="/", pmeta:dict|None = None, chain: tuple = ()):
+        try:
+            return await self._get(path, dir, pmeta, chain)
         except MissingSecretInstaller:
             logger.info(f"No installable secret in {path}")
+            return {}
+
+    async def get(self, path:str, dir: str = "/", pmeta:dict|None = None, chain: tuple = ()):
+        return await self._get_node(path, dir, pmeta, chain=chain)
+
+    async def _get_node(self, path:str, dir: str = "/", pmeta:dict|None = None, kind: str|None = None, chain: tuple = ()):
+        # Read current path as a secret and as a dir of secret at the same time
+        ret, subs = await gather_or_cancel(
+            self._get_installable(path, dir, pmeta, chain) if kind != NODE_DIR else asyncio.sleep(0, {}),
+            self._gets(path, dir, pmeta) if kind != NODE_LEAF else asyncio.sleep(0, [])
+        )
+        for sub in await gather_or_cancel(*(
+                self._get_node(subpath, dir + sub, pmeta=pmeta, kind=node_kind(sub), chain=chain) for (sub, subpath) in subs)):
+            ret.update(sub)
 
-        # Try to read current path as a dir of secret
-        for (sub, subpath) in self._gets(path, dir, pmeta):
-                ret.update(self.get(subpath, dir + sub, pmeta=pmeta))
-        
         # Did we have some secrets ?
         if len(ret) == 0:
             logger.info(f"No secrets in ${path}")
@@ -1,33 +1,89 @@
 import hvac
-import structlog
 import requests
+import requests.adapters
+from urllib3.connection import HTTPConnection
 
-import pprint
+import socket
+import threading
+import time
 
-from .Secrets import SecretGetter
+from .Secrets import SecretGetter, Secret
+from ..lib.metrics import METRICS, record_request
+from .limiter import ThreadLimiter, parse_retry_after, retry_delay
+from .tokencache import TokenCache
 
 import logging
 logger = logging.getLogger(__name__)
 
-def get_vault_client(vault_url, certs):
+# Vault is overloaded or unreachable: back off and retry
+RETRYABLE_ERRORS = (
+    hvac.exceptions.RateLimitExceeded,
+    hvac.exceptions.VaultDown,
+    hvac.exceptions.BadGateway,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+)
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter with TCP keep-alive on pooled sockets, so idle TLS
+    connections survive between syncs, and counters of connection reuse.
+    """
+    def __init__(self, keepalive: bool = True, **kwargs):
+        self._keepalive = keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self._keepalive:
+            pool_kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def stats(self) -> dict:
+        # Requests sent and connections opened by all pools of this adapter
+        requests = connections = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+        return {"requests": requests, "connections": connections,
+                "reused": max(0, requests - connections)}
+
+def get_vault_client(vault_url, certs, pool_connections=10, pool_maxsize=10,
+                     timeout=30, keepalive=True):
         """
         Instantiates a hvac / vault client.
         :param vault_url: string, protocol + address + port for the vault service
         :param certs: tuple, Optional tuple of self-signed certs to use for verification
                 with hvac's requests adapter.
+        :param pool_connections: int, number of host pools to cache
+        :param pool_maxsize: int, maximum connections kept per host
+        :param timeout: int, seconds before a request times out
+        :param keepalive: bool, enable TCP keep-alive on pooled connections
         :return: hvac.Client
         """
         logger.debug('Retrieving a vault (hvac) client...')
-        vault_client = hvac.Client(
-                url=vault_url,
-                verify=certs,
+        rs = requests.Session()
+        adapter = PooledHTTPAdapter(
+                keepalive=keepalive,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
         )
+        rs.mount("https://", adapter)
+        rs.mount("http://", adapter)
         if certs:
         # When use a self-signed certificate for the vault service itself, we need to
         # include our local ca bundle here for the underlying requests module.
-                rs = requests.Session()
-                vault_client.session = rs
                 rs.verify = certs
+        vault_client = hvac.Client(
+                url=vault_url,
+                verify=certs,
+                timeout=timeout,
+                session=rs,
+        )
 
         return vault_client
 
@@ -38,23 +94,55 @@ class VaultClient(SecretGetter):
     def _conf(self, args, kwargs):
         super()._conf(args, kwargs)
         self._config = kwargs.get("config")
+        concurrency = int(self._config.get("VAULT_CONCURRENCY") or 1)
         self._hvac_client = get_vault_client(
              self._config["VAULT_ADDRESS"], 
-             self._config["VAULT_CA"]
+             self._config["VAULT_CA"],
+             pool_connections=self._config.get("VAULT_POOL_CONNECTIONS") or 10,
+             # Never fewer connections than concurrent workers
+             pool_maxsize=max(self._config.get("VAULT_POOL_MAXSIZE") or 10, concurrency),
+             timeout=self._config.get("VAULT_TIMEOUT") or 30,
+             keepalive=self._config.get("VAULT_KEEPALIVE", True)
+        )
+        self._auth_lock = threading.RLock()
+        self._limiter = ThreadLimiter(
+             concurrency,
+             minimum=self._config.get("VAULT_MIN_CONCURRENCY") or 1,
+             target_latency=self._config.get("VAULT_TARGET_LATENCY") or 0.5
         )
-        self._auth()
+        # hvac exceptions drop the response: keep Retry-After of each thread
+        self._last_response = threading.local()
+        self._hvac_client.session.hooks["response"].append(self._on_response)
+        # Negative cache: (operation, path) already known to be missing
+        self._missing = set()
+        # Token of the approle / JWT login shared with the next runs
+        self._token_cache = TokenCache.from_config(self._config)
+        self._token_key = TokenCache.key_of(self._config) if self._token_cache else None
+        self._token_accessor = None
+        # Token looked up in this run: a later 403 is a denied path
+        self._token_checked = False
+        self._token_expiry = None
+        # Login on the first request: an unreachable Vault fails its sync only
+        self._authenticated = False
+        self._token_refresh = None
+        self._token_renewable = False
 
-    def _auth(self):
+    def _auth(self, cached: bool = True):
         if self._config["VAULT_TOKEN"]:
             self._hvac_client.token = self._config["VAULT_TOKEN"]
 
+        if cached and self._cached_token():
+            self._authenticated = True
+            return
+
         if self._config["VAULT_ROLE_ID"] and self._config["VAULT_SECRET_ID"]:
             auth_mount_point = self._config["VAULT_AUTHPATH"] or 'approle'
-            self.hvac_client.auth.approle.login(
+            self._hvac_client.auth.approle.login(
                 self._config["VAULT_ROLE_ID"],
                 self._config["VAULT_SECRET_ID"],
                 mount_point=auth_mount_point
             )
+            METRICS.inc("vault_logins_total")
 
         if self._config["VAULT_JWT_ROLE"] and self._config["VAULT_JWT_KEY"]:
             self._hvac_client.auth.jwt.jwt_login(
@@ -62,44 +150,233 @@ class VaultClient(SecretGetter):
                 self._config["VAULT_JWT_KEY"],
                 path=self._config["VAULT_AUTHPATH"]
             )
+            METRICS.inc("vault_logins_total")
+        self._lookup_token()
+        self._authenticated = True
+
+    def _cached_token(self) -> bool:
+        # Token of an earlier run, renewed once close to its expiry
+        if self._token_key is None:
+            return False
+        entry = self._token_cache.get(self._token_key)
+        if entry is None:
+            return False
+        self._hvac_client.token = entry["token"]
+        self._token_accessor = entry.get("accessor")
+        ttl = entry["expires"] - time.time() if entry.get("expires") is not None else 0
+        self._set_token_ttl(ttl, entry.get("renewable", False))
+        logger.debug("Vault token from cache")
+        METRICS.inc("token_cache_hits_total")
+        return True
+
+    def _store_token(self, ttl: int, renewable: bool):
+        if self._token_key is not None:
+            self._token_cache.set(self._token_key, self._hvac_client.token, ttl, renewable, self._token_accessor)
+
+    def _lookup_token(self):
+        # Single lookup-self after login: keep TTL & renewability in memory
+        try:
+            data = self._hvac_client.auth.token.lookup_self()["data"]
+        except (hvac.exceptions.Forbidden, hvac.exceptions.Unauthorized) as e:
+            raise Exception('Not authenticated') from e
+        self._token_accessor = data.get("accessor")
+        self._token_checked = True
+        self._set_token_ttl(data.get("ttl") or 0, data.get("renewable", False))
+        self._store_token(data.get("ttl") or 0, data.get("renewable", False))
+
+    def _set_token_ttl(self, ttl: int, renewable: bool):
+        # ttl of 0 means a token without expiry (e.g. root token)
+        self._token_renewable = renewable
+        if not ttl:
+            self._token_refresh = None
+            return
+        if not renewable and not self._can_login():
+            # Static token: nothing to refresh, it only expires
+            self._token_refresh = None
+            expiry = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() + ttl))
+            if self._token_expiry != expiry:
+                self._token_expiry = expiry
+                logger.info(f"Vault token is not renewable, it expires at {expiry}")
+            return
+        # Never renew earlier than half-life, short TTLs would renew on each call
+        margin = min(self._config.get("VAULT_TOKEN_RENEW_MARGIN") or 0, ttl / 2)
+        self._token_refresh = time.monotonic() + ttl - margin
+
+    def _can_login(self) -> bool:
+        # A new token can be obtained with the approle / JWT login
+        return bool((self._config["VAULT_ROLE_ID"] and self._config["VAULT_SECRET_ID"]) or
+                    (self._config["VAULT_JWT_ROLE"] and self._config["VAULT_JWT_KEY"]))
+
+    def reset(self):
+        super().reset()
+        self._missing.clear()
+        self._token_checked = False
+
+    def connection_stats(self) -> dict:
+        adapter = self._hvac_client.session.get_adapter(self._config["VAULT_ADDRESS"])
+        if isinstance(adapter, PooledHTTPAdapter):
+            return adapter.stats()
+        return {}
+
+    def token_refresh_delay(self) -> float|None:
+        if self._token_refresh is None:
+            return None
+        return max(0, self._token_refresh - time.monotonic())
+
+    def _token_fresh(self) -> bool:
+        return self._authenticated and (
+            self._token_refresh is None or time.monotonic() < self._token_refresh)
+
+    def _ensure_auth(self):
+        # Revalidate only when the token is close to its expiry
+        if self._token_fresh():
+            return
+        with self._auth_lock:
+            if self._token_fresh():
+                return
+            if not self._authenticated:
+                # Cached token only for the first login
+                self._auth()
+                return
+            if self._token_renewable:
+                try:
+                    auth = self._hvac_client.auth.token.renew_self()["auth"]
+                    self._set_token_ttl(auth.get("lease_duration") or 0, auth.get("renewable", False))
+                    self._store_token(auth.get("lease_duration") or 0, auth.get("renewable", False))
+                    logger.debug("Vault token renewed")
+                    return
+                except hvac.exceptions.VaultError as e:
+                    logger.info(f"Can't renew vault token, login again: {e!s}")
+            self._auth(cached=False)
+
+    def _on_response(self, resp, *args, **kwargs):
+        self._last_response.retry_after = resp.headers.get("Retry-After")
+        record_request(resp.request.method, resp.url, resp.elapsed.total_seconds(), len(resp.content))
+
+    def _call(self, method, **kwargs):
+        # Call an hvac method under the concurrency limiter, retry on overload
+        retries = self._config.get("VAULT_RETRIES") or 0
+        attempt = 0
+        while True:
+            self._last_response.retry_after = None
+            self._limiter.acquire()
+            start = time.monotonic()
+            try:
+                ret = method(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._limiter.release(overloaded=True)
+                if attempt >= retries:
+                    raise
+                delay = retry_delay(
+                    attempt,
+                    parse_retry_after(self._last_response.retry_after),
+                    base=self._config.get("VAULT_RETRY_BACKOFF") or 0.5,
+                    cap=self._config.get("VAULT_RETRY_MAX_DELAY") or 30
+                )
+                logger.info(f"Vault overloaded ({e.__class__.__name__}), retry in {delay:.2f}s")
+                METRICS.inc("vault_retries_total")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._limiter.release(time.monotonic() - start)
+                raise
+            self._limiter.release(time.monotonic() - start)
+            return ret
+
+    def _request(self, method, **kwargs):
+        # Call an hvac method with a valid token, login again once on 403
+        self._ensure_auth()
+        token = self._hvac_client.token
+        try:
+            return self._call(method, **kwargs)
+        except hvac.exceptions.Forbidden:
+            with self._auth_lock:
+                if self._token_checked and self._token_fresh():
+                    # Token already looked up in this run and not expiring
+                    raise
+                if self._hvac_client.token == token:
+                    try:
+                        self._lookup_token()
+                        valid = True
+                    except Exception:
+                        valid = False
+                    if valid:
+                        # Token still valid: access to this path is denied
+                        raise
+                    logger.info("Vault token rejected, login again")
+                    if self._token_key is not None:
+                        self._token_cache.discard(self._token_key)
+                    self._auth(cached=False)
+            return self._call(method, **kwargs)
+
     def _get(self, path: str, dir: str ="/", pmeta:dict|None = None):
-        if not self._hvac_client.is_authenticated():
-            raise Exception('Not authenticated')
+        secret = self._get_data(path, dir=dir, pmeta=pmeta)
+        if len(secret) == 0:
+            return {}
+        meta = self._get_meta(path, dir, pmeta)
+        if len(meta) == 0:
+            return {}
+        secret.update(meta)
+        return secret
+
+    def _get_meta(self, path: str, dir: str ="/", pmeta:dict|None = None):
         mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
+        if ("metadata", path) in self._missing:
+            return {}
         try:
-            resp = self._hvac_client.secrets.kv.v2.read_secret_version(
-                path=path,
+            mresp = self._request(
+                self._hvac_client.secrets.kv.v2.read_secret_metadata,
+                path = path,
                 mount_point=mount_point
             )
-            mresp = self._hvac_client.secrets.kv.v2.read_secret_metadata(
-                path = path,
+        except hvac.exceptions.InvalidPath as e:
+            logger.debug(f"{path} has no secret")
+            self._missing.add(("metadata", path))
+            return {}
+        try:
+            return {"metadata": mresp["data"]}
+        except KeyError as e:
+            logger.debug(f"_get_meta return keyerror: {e!s}")
+            return {}
+
+    def _get_data(self, path: str, version: int|None = None, dir: str ="/", pmeta:dict|None = None):
+        mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
+        if ("data", path) in self._missing:
+            return {}
+        try:
+            resp = self._request(
+                self._hvac_client.secrets.kv.v2.read_secret_version,
+                path=path,
+                version=version,
                 mount_point=mount_point
             )
         except hvac.exceptions.InvalidPath as e:
             logger.debug(f"{path} has no secret")
+            if version is None:
+                self._missing.add(("data", path))
             return {}
         try:
-            return {
-                "secret": resp["data"],
-                "metadata": mresp["data"]
-            }
+            return {"secret": resp["data"]}
         except KeyError as e:
-            logger.debug(f"_get return keyerror: {e!s}")
+            logger.debug(f"_get_data return keyerror: {e!s}")
             return {}
     
     def _gets(self, path: str, dir: str ="/", pmeta:dict|None = None):
-        if not self._hvac_client.is_authenticated():
-            raise Exception('Not authenticated')
         mount_point = self._config["VAULT_SECRETS_MOUNTPOINT"] or "kv"
         if path[-1] == '/':
              path = path[:-1]
+        if ("list", path) in self._missing:
+            return []
         try:
-            resp = self._hvac_client.secrets.kv.v2.list_secrets(
+            resp = self._request(
+                self._hvac_client.secrets.kv.v2.list_secrets,
                 path=path,
                 mount_point=mount_point
             )
         except hvac.exceptions.InvalidPath as e:
             logger.debug(f"{path} is not a directory")
+            self._missing.add(("list", path))
             return []
         try:
             return [ (k, f"{path}/{k}") for k in resp["data"]["keys"]]
@@ -107,3 +384,7 @@ class VaultClient(SecretGetter):
             logger.debug(f"gets return keyerror: {e!s}")
             return []
     
+
+
+class VaultSecret(Secret, VaultClient):
+    pass
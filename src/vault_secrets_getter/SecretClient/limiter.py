@@ -0,0 +1,114 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+from ..lib.metrics import METRICS
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AIMDLimiter:
+    """
+    Adaptive limit of requests in flight (additive increase, multiplicative decrease).
+
+    While responses come back faster than target_latency, the limit grows by
+    one per full window of requests. On overload (429, 503, timeout) it is cut
+    by backoff, at most once per target_latency so a burst of rejected
+    requests sent in the same window only counts once.
+    """
+    def __init__(self, maximum: int, minimum: int = 1, initial: int|None = None,
+                 target_latency: float = 0.5, backoff: float = 0.5):
+        self._max = max(1, maximum)
+        self._min = max(1, min(minimum, self._max))
+        if initial is None:
+            initial = self._max // 4
+        self._limit = float(min(self._max, max(self._min, initial)))
+        self._target = target_latency
+        self._backoff = backoff
+        self._last_decrease = 0.0
+        self._inflight = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _can_start(self) -> bool:
+        return self._inflight < int(self._limit)
+
+    def _update(self, latency: float|None, overloaded: bool) -> None:
+        # latency None: the request failed for another reason, keep the limit
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= self._target:
+                self._last_decrease = now
+                self._limit = max(self._min, self._limit * self._backoff)
+                logger.debug(f"Vault overloaded, concurrency limit down to {self.limit}")
+                METRICS.inc("vault_backoffs_total")
+        elif latency is not None and latency <= self._target:
+            self._limit = min(self._max, self._limit + 1 / self._limit)
+
+
+class ThreadLimiter(AIMDLimiter):
+    # AIMDLimiter for worker threads
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._cond.wait_for(self._can_start)
+            self._inflight += 1
+
+    def release(self, latency: float|None = None, overloaded: bool = False) -> None:
+        with self._cond:
+            self._inflight -= 1
+            self._update(latency, overloaded)
+            self._cond.notify_all()
+
+
+class AsyncLimiter(AIMDLimiter):
+    # AIMDLimiter for coroutines of one event loop
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(self._can_start)
+            self._inflight += 1
+
+    async def release(self, latency: float|None = None, overloaded: bool = False) -> None:
+        async with self._cond:
+            self._inflight -= 1
+            self._update(latency, overloaded)
+            self._cond.notify_all()
+
+
+def parse_retry_after(value: str|None) -> float|None:
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+def retry_delay(attempt: int, retry_after: float|None = None,
+                base: float = 0.5, cap: float = 30) -> float:
+    # Full jitter exponential backoff, never earlier than the server asked
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from ..SecretInstaller.state import StateIndex
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Folder listings of the last syncs, next to the installed secrets:
+{"format": 1, "entries": {"<vault folder>": {"keys": ["s0", "d1/"], "listed": 1700000000.0, "versions": {"s0": 3}}}}
+With VAULT_SOURCES, folders of each source are scoped by its name: "<source> <vault folder>"
+"""
+class ListingIndex(StateIndex):
+    FILENAME = ".vault-secrets-getter.listing"
+    CONFIG_KEY = "VAULT_LISTING_FILE"
+
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self._update_lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str, scope: str = "") -> str:
+        path = path.rstrip('/')
+        return f"{scope} {path}" if scope else path
+
+    def listing(self, path: str, ttl: float, scope: str = "") -> list|None:
+        # Cached [(sub, subpath)] of a folder listed less than ttl seconds ago
+        # scope: source of the folder, listings of other sources are not shared
+        path = path.rstrip('/')
+        entry = self.get(self._key(path, scope))
+        if entry is None or time.time() - entry["listed"] >= ttl:
+            return None
+        return [(k, f"{path}/{k}") for k in entry["keys"]]
+
+    def store(self, path: str, subs: list, scope: str = "") -> None:
+        path = self._key(path, scope)
+        keys = [k for (k, subpath) in subs]
+        with self._update_lock:
+            old = self.get(path) or {"keys": [], "versions": {}}
+            for k in old["keys"]:
+                if k.endswith('/') and k not in keys:
+                    self._discard_tree(f"{path}/{k}")
+            self.set(path, {
+                "keys": keys,
+                "listed": time.time(),
+                # Last seen version of leaves still listed
+                "versions": {k: v for k, v in old["versions"].items() if k in keys},
+            })
+
+    def seen(self, path: str, version: int|None, scope: str = "") -> None:
+        # Record the version of a listed leaf (None: missing). A new version
+        # or a missing leaf means the folder changed: list it again next run.
+        if '/' not in path:
+            return
+        parent, name = path.rsplit('/', 1)
+        parent = self._key(parent, scope)
+        with self._update_lock:
+            entry = self.get(parent)
+            if entry is None or name not in entry["keys"]:
+                return
+            known = name in entry["versions"]
+            if known and entry["versions"][name] == version:
+                return
+            entry = dict(entry, versions=dict(entry["versions"]))
+            entry["versions"][name] = version
+            if version is None or known:
+                logger.debug(f"{path} changed, revalidate listing of {parent}")
+                entry["listed"] = 0
+            self.set(parent, entry)
+
+    def _discard_tree(self, path: str) -> None:
+        # Forget cached listings of a folder removed from Vault
+        # path: key of the folder, with its scope
+        path = path.rstrip('/')
+        entries = self._load()
+        with self._lock:
+            for key in [k for k in entries if k == path or k.startswith(path + '/')]:
+                del entries[key]
+                self._dirty = True
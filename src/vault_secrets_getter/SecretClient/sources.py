@@ -0,0 +1,184 @@
+import queue
+import threading
+
+from ..lib.metrics import METRICS
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Source:
+    """
+    One Vault of VAULT_SOURCES: its client (own address, auth, mount and
+    connection pool), the event loop of an async client, and the prefix of
+    the secret paths read from it.
+    """
+    def __init__(self, secret, config, loop=None):
+        self.secret = secret
+        self.loop = loop
+        self.prefix = (config.get("VAULT_PATH_PREFIX") or "").strip('/')
+        self.name = self.name_of(config)
+        # Installers fetched ahead and kept with their data (0: no limit)
+        self.buffer = int(config.get("SECRET_PIPELINE_BUFFER") or 0)
+
+    @staticmethod
+    def name_of(config) -> str:
+        return f"{config['VAULT_ADDRESS']}/{config['VAULT_SECRETS_MOUNTPOINT'] or 'kv'}"
+
+    def run(self, ret):
+        # Resolve coroutines of the async backend on its event loop
+        if self.loop is None:
+            return ret
+        return self.loop.run_until_complete(ret)
+
+    def path(self, path: str) -> str:
+        if not self.prefix:
+            return path
+        return f"{self.prefix}/{path.lstrip('/')}"
+
+    def stream_into(self, path: str, base: str):
+        return self.secret.stream_into(self.path(path), base, runner=self.run)
+
+    def reload(self, installers: list) -> list:
+        # Data of released installers read again, see Secret.reload_all
+        return self.run(self.secret.reload_all(installers))
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.run_until_complete(self.secret.aclose())
+            self.loop.close()
+
+
+class SourceMerge:
+    """
+    Installers of one entry (path, base) read from several sources at the
+    same time, as one stream of (source index, key, installer).
+
+    Every source is drained as fast as its walk goes: the merge takes
+    installers in the order they come. One is handed over at once when no
+    source before its own is still running. Otherwise it waits until they
+    are exhausted: an earlier source installing the same file wins. Beyond
+    the buffer of its source, a waiting installer drops its data and reads
+    it again from its source if it is handed over, so memory stays bounded.
+
+    A failing source is logged and skipped, the others are still handed
+    over; errors lists (source index, exception). Once exhausted, keys lists
+    (source index, key) of every source that completed, in source order.
+    """
+    _DONE = object()
+
+    def __init__(self, sources: list, path: str, base: str):
+        self.keys = []
+        self.errors = []
+        self._sources = sources
+        self._streams = [source.stream_into(path, base) for source in sources]
+        self._queue = queue.Queue(maxsize=max(source.buffer for source in sources))
+        self._stopped = threading.Event()
+
+    def _pump(self, i: int, stream):
+        error = None
+        try:
+            for key, installer in stream:
+                if self._stopped.is_set():
+                    break
+                self._queue.put((i, key, installer))
+        except BaseException as e:
+            error = e
+        self._queue.put((i, self._DONE, error))
+
+    def _skip(self, owner: dict, i: int, key: str, destination: str) -> bool:
+        # True if an earlier source installs the same file
+        if owner[destination] < i:
+            logger.info(f"{key} of source {self._sources[i].name} skipped: {destination} comes from source {self._sources[owner[destination]].name}")
+            return True
+        return False
+
+    def _reloaded(self, owner: dict, i: int, waiting: list):
+        # Released installers of an exhausted source: read their data again,
+        # all at once
+        waiting = [(key, installer) for key, installer, destination in waiting
+                   if not self._skip(owner, i, key, destination)]
+        stale = [installer for key, installer in waiting if not installer.is_current()]
+        reloaded = dict(zip(map(id, stale), self._sources[i].reload(stale))) if stale else {}
+        for key, installer in waiting:
+            ret = reloaded.get(id(installer), True)
+            if isinstance(ret, BaseException):
+                logger.error(f"Can't read {key} of source {self._sources[i].name} again : {ret!s}")
+                METRICS.inc("source_errors_total")
+            elif not ret:
+                logger.error(f"{key} of source {self._sources[i].name} is gone, not installed")
+            else:
+                yield i, key, installer
+
+    def _claim(self, owner: dict, held: list, i: int, key: str, destination: str) -> bool:
+        # Record source i installing destination: False if an earlier source
+        # does. Installers held by later sources for it are dropped, making
+        # room in their buffers.
+        first = owner.setdefault(destination, i)
+        if first < i:
+            self._skip(owner, i, key, destination)
+            return False
+        if first > i:
+            owner[destination] = i
+            for j in range(i + 1, len(held)):
+                for entry in [entry for entry in held[j] if entry[2] == destination]:
+                    self._skip(owner, j, entry[0], destination)
+                    held[j].remove(entry)
+        return True
+
+    def __iter__(self):
+        count = len(self._streams)
+        threads = [threading.Thread(target=self._pump, args=(i, stream), name=f"vault-source-{i}", daemon=True)
+                   for i, stream in enumerate(self._streams)]
+        for thread in threads:
+            thread.start()
+        running = count
+        done = [False] * count
+        # Sources before ready are all exhausted
+        ready = 0
+        # Earliest source installing each file
+        owner = {}
+        # (key, installer, destination) waiting for the sources before theirs:
+        # held with their data, released ones once their source is exhausted
+        held = [[] for _ in range(count)]
+        released = [[] for _ in range(count)]
+        try:
+            while running:
+                i, key, value = self._queue.get()
+                if key is not self._DONE:
+                    destination = value.destination()
+                    if not self._claim(owner, held, i, key, destination):
+                        continue
+                    if i <= ready:
+                        yield i, key, value
+                    elif not self._sources[i].buffer or len(held[i]) < self._sources[i].buffer:
+                        held[i].append((key, value, destination))
+                    else:
+                        value.release()
+                        released[i].append((key, value, destination))
+                    continue
+                running -= 1
+                if value is not None:
+                    logger.error(f"Source {self._sources[i].name} failed, skip it: {value!s}")
+                    METRICS.inc("source_errors_total")
+                    self.errors.append((i, value))
+                done[i] = True
+                while ready < count and done[ready]:
+                    # Exhausted sources: all their installers can be decided
+                    yield from self._reloaded(owner, ready, released[ready])
+                    ready += 1
+                    if ready < count:
+                        for key, installer, destination in held[ready]:
+                            if not self._skip(owner, ready, key, destination):
+                                yield ready, key, installer
+                        held[ready].clear()
+            self.keys = [(i, key) for i, stream in enumerate(self._streams) for key in stream.keys]
+        finally:
+            if running:
+                # Stopped early: stop the other walks, unblock their threads
+                self._stopped.set()
+                while running:
+                    if self._queue.get()[1] is self._DONE:
+                        running -= 1
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,110 @@
+import os
+import json
+import stat
+import tempfile
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Tokens of approle / JWT logins, reused by the next runs until they expire:
+{"format": 1, "tokens": {"<address> <auth path> <role>": {"token": "...", "accessor": "...", "expires": 1700000000.0, "renewable": true}}}
+"""
+class TokenCache:
+    FORMAT = 1
+
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "TokenCache|None":
+        # Opt-in: None without VAULT_TOKEN_CACHE
+        filepath = config.get("VAULT_TOKEN_CACHE")
+        if not filepath:
+            return None
+        return cls(filepath)
+
+    @staticmethod
+    def key_of(config) -> str|None:
+        # Entry of the configured login, None without approle or JWT login
+        if config.get("VAULT_ROLE_ID") and config.get("VAULT_SECRET_ID"):
+            return f"{config['VAULT_ADDRESS']} {config['VAULT_AUTHPATH'] or 'approle'} {config['VAULT_ROLE_ID']}"
+        if config.get("VAULT_JWT_ROLE") and config.get("VAULT_JWT_KEY"):
+            return f"{config['VAULT_ADDRESS']} {config['VAULT_AUTHPATH'] or 'jwt'} {config['VAULT_JWT_ROLE']}"
+        return None
+
+    @property
+    def filepath(self) -> str:
+        return self._filepath
+
+    def _load(self) -> dict:
+        try:
+            with open(self._filepath, "r") as f:
+                # Holds credentials: only trust a file nobody else can read or write
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+                    logger.error(f"Token cache {self._filepath} must be owned by uid {os.getuid()} with mode 0600, ignore it")
+                    return {}
+                content = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Can't read token cache {self._filepath} : {e!s}")
+            return {}
+        if content.get("format") != self.FORMAT:
+            logger.error(f"Unknown format of token cache {self._filepath}, ignore it")
+            return {}
+        return content.get("tokens", {})
+
+    def _save(self, tokens: dict) -> None:
+        # Atomically replace the cache, created 0600 by mkstemp
+        dirname = os.path.dirname(self._filepath) or "."
+        try:
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=dirname, prefix=".token.")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"format": self.FORMAT, "tokens": tokens}, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmppath, self._filepath)
+            except BaseException:
+                os.unlink(tmppath)
+                raise
+        except OSError as e:
+            logger.error(f"Can't save token cache {self._filepath} : {e!s}")
+
+    def get(self, key: str) -> dict|None:
+        # Cached token of key, None if missing or expired
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None
+        if entry.get("expires") is not None and entry["expires"] <= time.time():
+            return None
+        return entry
+
+    def set(self, key: str, token: str, ttl: float, renewable: bool, accessor: str|None = None) -> None:
+        # ttl of 0 means a token without expiry
+        entry = {
+            "token": token,
+            "accessor": accessor,
+            "expires": time.time() + ttl if ttl else None,
+            "renewable": renewable,
+        }
+        with self._lock:
+            tokens = self._load()
+            if tokens.get(key) == entry:
+                return
+            tokens[key] = entry
+            self._save(tokens)
+
+    def discard(self, key: str) -> None:
+        # Token revoked or rejected: log in again next time
+        with self._lock:
+            tokens = self._load()
+            if tokens.pop(key, None) is not None:
+                self._save(tokens)
@@ -1,6 +1,4 @@
-import structlog
 import os
-import copy
 
 from .base import SecretInstaller
 
@@ -40,16 +38,14 @@ class x509(SecretInstaller):
             "type": "urn:scheme:type:certificate"
         }
         """
-        perm = copy.deepcopy(self._parentPerms)
-        perm.update(self._curPerms)
+        perm = self._perms
         dir = self._base + self._dir
         for filekey,filename in x509.FILENAME.items():
             # Get permission from parent & current secret
             try:
                 content = self._secret["secret"]["data"][filekey]
                 filepath=f"{dir}/{filename}"
-                with open(filepath, 'wt') as file:
-                    file.write(content)
+                self._writeFile(filepath, content.encode("utf_8"), perm)
                 self._secretFiles[filepath] = (
                     perm.get("user"),
                     perm.get("group"),
@@ -58,5 +54,5 @@ class x509(SecretInstaller):
                 )
             except KeyError as e:
                 logger.error(f"Can't get x509 data of {filekey} in {self._path} : {e!s}")
-            except OSError as e:
+            except (OSError, ValueError) as e:
                 logger.error(f"Error when opening/writing the file {filepath} : {e!s}")
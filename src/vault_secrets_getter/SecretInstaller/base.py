@@ -1,12 +1,14 @@
-import structlog
 import os 
-import posix1e
-import shutil
 import json
-import copy
+import hashlib
+import tempfile
 
 import base64 as b64
 
+from .planner import InstallPlanner
+from .perms import EMPTY_PERMS, PermPlan, compile_perms, parse_perms, merge_perms
+from ..lib.metrics import METRICS
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -25,22 +27,20 @@ class MissingSecretInstaller(Exception):
         return f'InstallSecretError({type}, XXXXXX)'
 
 class SecretInstaller:
-    ERR_STR = {
-        posix1e.ACL_MULTI_ERROR: "The ACL contains multiple entries that have a tag type that may occur at most once.",
-        posix1e.ACL_DUPLICATE_ERROR: "The ACL contains multiple ACL_USER or ACL_GROUP entries with the same ID.",
-        posix1e.ACL_MISS_ERROR: "A required entry is missing.",
-        posix1e.ACL_ENTRY_ERROR: "The ACL contains an invalid entry tag type."
-    }
-    
     def __init__(self, *args, **kwargs):
         super().__init__()
         self._secretFiles = {}
-        self._meta = {}
-        self._parentmeta = {}
+        # Metadata and permissions are read-only, shared with other installers
+        self._meta = EMPTY_PERMS
+        self._parentmeta = EMPTY_PERMS
         self._dirname = None
         self._filename = None
-        self._parentPerms = {}
-        self._curPerms = {}
+        self._parentPerms = EMPTY_PERMS
+        self._curPerms = EMPTY_PERMS
+        # Parent permissions updated by current ones
+        self._perms = EMPTY_PERMS
+        # Digest of released secret data
+        self._released = None
         self._conf(args, kwargs)
         
 
@@ -55,84 +55,69 @@ class SecretInstaller:
         return path
     
     @staticmethod
-    def _changePerm(file: str, perm: str|None = None, extended: str|None = None) -> bool:
-        ret = True
-        if perm is not None:
-            ret &= SecretInstaller._changeSPerm(file, perm)
-        if extended is not None:
-            ret &= SecretInstaller._changeExtendedPerm(file, extended)
-        return ret
-    
-    @staticmethod
-    def _changeSPerm(file: str, perm: str|None = None) -> bool:
-        if perm is None:
-            return False
-        try:
-            iPerm = int(perm, base=8)
-        except ValueError as e:
-            logger.error(f"Can't convert {perm} to integer value. perm should be 0oXXX in octal mode: {e!s}")
-            return False
-        try:
-            os.chmod(file, iPerm)
-        except Exception as e:
-            logger.error(f"Can't change perm on file {file}: {e!s}")
-            return False
-        return True
-    
-    @staticmethod
-    def _changeExtendedPerm(file: str, extended: str|None = None) -> bool:
-        if extended is None:
-            return False
+    def _saveSecret(path: str, content: bytes, plan: PermPlan|None = None, fsync: str = "file") -> bool:
+        # Atomically replace path with content, only if its content differs.
+        # The new file gets owner, mode and ACL of plan before the rename.
+        # fsync: "never", "file" (data before rename) or "always" (also the directory)
+        # Return True if the file was written
+        digest = hashlib.sha256(content).digest()
+        current = None
         try:
-            acl = posix1e.ACL(text=extended)
-        except OSError as e:
-            logger.error(f"'{extended}' is not correct extended permission: {e!s}")
-            return False
-        try:
-            if not acl.valid():
-                logger.error(f"Extended permission '{extended}' not valid:")
-                err = acl.check()
-                sErr = SecretInstaller.ERR_STR.get(err[0], "Unknown error, should not appear")
-                logger.error(f"Pos {err[1]}: {sErr}")
-                return False
-            acl.applyto(file)
-        except OSError as e:
-            logger.error(f"Can't apply ACL({extended}) to file '{file}")
-            return False
-        return True
-    
-    @staticmethod
-    def _chown(file: str, user: str|None = None, group: str|None = None) -> bool:
-        if user is None and group is None:
-            return False
+            with open(path, 'rb') as file:
+                if hashlib.sha256(file.read()).digest() == digest:
+                    return False
+                current = os.fstat(file.fileno())
+        except FileNotFoundError:
+            pass
+        dirname = os.path.dirname(path)
+        fd, tmppath = tempfile.mkstemp(dir=dirname, prefix=f".{os.path.basename(path)}.")
         try:
-            shutil.chown(file, user=user, group=group)
-        except Exception as e:
-            logger.error(f"Can't set permission to file {file} : {e!s}")
-            return False
+            (plan or PermPlan()).apply_fd(fd, path, current)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+                if fsync != "never":
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmppath, path)
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+        if fsync == "always":
+            dfd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dfd)
+            finally:
+                os.close(dfd)
         return True
 
-        
-    
-    @staticmethod
-    def _saveSecret(path: str, content: bytes) -> None:
-        with open(path, 'wb') as file:
-            file.write(content)
+    def _writeFile(self, path: str, content: bytes, perm: dict) -> bool:
+        # Shared write path of installers: created with the final permissions, then renamed
+        plan = compile_perms(perm.get("user"), perm.get("group"), perm.get("perms"), perm.get("extended"))
+        with METRICS.timer("install_seconds", phase="write"):
+            written = self._saveSecret(path, content, plan, self._config.get("SECRET_FSYNC") or "file")
+        if written:
+            METRICS.inc("install_files_total", result="written")
+            METRICS.inc("install_bytes_total", len(content))
+        else:
+            METRICS.inc("install_files_total", result="unchanged")
+        return written
     
     def _conf(self, args, kwargs):
         self._secret = kwargs.get('secret')
         self._getter = kwargs.get('getter')
         self._config = kwargs.get('config')
+        # Shared StateIndex of installed versions (None: legacy .meta files)
+        self._state = kwargs.get('state')
 
-        self._parentmeta = copy.deepcopy(kwargs.get('parentmeta') or {})
+        self._parentmeta = kwargs.get('parentmeta') or EMPTY_PERMS
         try:
-            self._meta = copy.deepcopy(self._secret["secret"]["metadata"]["custom_metadata"] or {})
+            self._meta = self._secret["secret"]["metadata"]["custom_metadata"] or EMPTY_PERMS
         except KeyError:
             # No custom metadata defined
             pass
         self._dir = kwargs.get('dir')
         self._path = kwargs.get('path')
-        self._base = self._config["SECRET_BASE_DIR"]
+        self._base = kwargs.get('base') or self._config["SECRET_BASE_DIR"]
 
         if self._base is None:
             self._base="/run/secrets"
@@ -140,16 +125,19 @@ class SecretInstaller:
         self._dir = self.sanitize_path(self._dir)
         self._base = self.sanitize_path(self._base)
 
-        self._parentPerms = self._parseJson(self._path, "parentMeta", self._parentmeta.get("secretPerms"), {})
-        self._curPerms = self._parseJson(self._path,"meta", self._meta.get("secretPerms"), {})
+        parentPerms = self._parentmeta.get("secretPerms")
+        curPerms = self._meta.get("secretPerms")
+        self._parentPerms = self._parseJson(self._path, "parentMeta", parentPerms, EMPTY_PERMS)
+        self._curPerms = self._parseJson(self._path,"meta", curPerms, EMPTY_PERMS)
+        self._perms = merge_perms(parentPerms, curPerms)
 
     @staticmethod
     def _parseJson(path: str, key: str, strJson: str|None, defaultVal: dict|None = None):
         if strJson is None:
             return defaultVal
-        # Try to decode JSON
+        # Try to decode JSON, once per distinct string
         try:
-            return json.loads(strJson)
+            return parse_perms(strJson)
         except json.JSONDecodeError as e:
             logger.error(f"Can't decode json from secretPerms in {path} § {key} : {e!s}")
             return defaultVal
@@ -185,14 +173,34 @@ class SecretInstaller:
     def _get_meta_filepath(self):
         return f"{self._dirname}/{self._filename}.meta"
     
+    def _loadVersion(self) -> dict|None:
+        filepath = self._get_meta_filepath()
+        if self._state is not None:
+            content = self._state.get(filepath)
+            if content is not None:
+                return content
+        # Not in the state index yet: fallback to legacy .meta file
+        with open(filepath, "r") as f:
+            return json.load(f)
+
+    def _digest(self) -> str|None:
+        data = self._secret["secret"].get("data")
+        if data is None:
+            return self._released
+        return "sha256:" + hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf_8")).hexdigest()
+
+    def _installedVersion(self) -> int|None:
+        # Version installed locally, None if unknown
+        try:
+            return self._loadVersion()["version"]
+        except Exception as e:
+            return None
+
     def _checkVersion(self) -> bool:
-        content = None
+        installed = self._installedVersion()
         try:
-            filepath = self._get_meta_filepath()
-            with open(filepath, "r") as f:
-                content=json.load(f)
             cur = self._secret["secret"]["metadata"]
-            if cur["version"] <= content["version"]:
+            if installed is not None and cur["version"] <= installed:
                 return False
         except Exception as e:
             pass
@@ -201,6 +209,10 @@ class SecretInstaller:
     def _saveVersion(self) -> None:
         cur = self._secret["secret"]["metadata"]
         content = {"created_time": cur["created_time"], "version": cur["version"]}
+        if self._state is not None:
+            content.update(path=self._path, digest=self._digest())
+            self._state.set(self._get_meta_filepath(), content)
+            return
         try:
             filepath = self._get_meta_filepath()
             with open(filepath, "w") as f:
@@ -210,40 +222,73 @@ class SecretInstaller:
     
     def _install(self):
         raise NotImplementedError()
+
+    def is_current(self) -> bool:
+        # True if the version of the secret is already installed locally
+        self._extractdir()
+        return not self._checkVersion()
     
-    def install(self) -> bool:
-        # Return if secret as changed (new version installed)
+    def destination(self) -> str:
+        # Local identity of the secret: its version file (or state index key)
+        self._extractdir()
+        return self._get_meta_filepath()
+
+    def plan(self) -> dict:
+        # Drift of this secret from its metadata only: "add", "update" or "current"
+        destination = self.destination()
+        installed = self._installedVersion()
+        status = "current"
+        if self._checkVersion():
+            status = "add" if installed is None else "update"
+        return {
+            "status": status,
+            "path": self._path,
+            "file": destination,
+            "version": self._secret["secret"]["metadata"].get("version"),
+            "installed": installed,
+        }
+
+    def prepare(self, planner: InstallPlanner) -> bool:
+        # Planning pass: return False if this version is already installed
         self._extractdir()
         if not self._checkVersion():
             return False
-        self.makedir()
+        if self._dirname is not None:
+            planner.mkdir(self._dirname)
         # try to see if we have perm/owner change saved in metadata
         # Try in parent meta and meta
         self._extractExtraPerms(self._parentPerms)
         self._extractExtraPerms(self._curPerms)
-
-        self._install()
-        # Extract owner & perms
-        for path, (user, group, perms, extended) in self._secretFiles.items():
-            self._chown(path, user=user, group=group)
-            self._changePerm(path, perms, extended)
-        self._saveVersion()
         return True
 
+    def release(self) -> None:
+        # Drop the secret data once installed, keep what _saveVersion needs
+        self._released = self._digest()
+        self._secret = {"secret": {"data": None, "metadata": self._secret["secret"]["metadata"]}}
+
+    def restore(self, data: dict) -> None:
+        # Data of a released installer, read again (see Secret.reload)
+        self._secret = {"secret": {"data": data, "metadata": self._secret["secret"]["metadata"]}}
+
+    def install(self) -> bool:
+        # Return if secret as changed (new version installed)
+        planner = InstallPlanner()
+        planner.add(self)
+        return planner.execute()
+
     def _install(self, path: str = ""):
         raise NotImplementedError()
     
-    def makedir(self):
-        if self._dirname is None:
-            return
-        os.makedirs(self._dirname, exist_ok=True)
-        
 class log(SecretInstaller):
-    def install(self):
+    def prepare(self, planner: InstallPlanner) -> bool:
+        return self.install()
+
+    def install(self) -> bool:
         logger.info(f"path : {self._path}")
         logger.info(f"secret : {self._secret}")
         logger.info(f"dir : {self._dirname}")
         logger.info(f"file : {self._filename}")
+        return False
     
 
 class baseX(SecretInstaller):
@@ -252,26 +297,24 @@ class baseX(SecretInstaller):
         return f"{self._base}{self._dir}/.meta"
     
     def _install(self):
-        perm = copy.deepcopy(self._parentPerms)
-        perm.update(self._curPerms)
+        perm = self._perms
         dir = self._base + self._dir
         binary = (self._meta.get("secretBinary", "0") == "1")
         try:
             for secretName,content in self._secret["secret"]["data"].items():
                 filepath = f"{dir}/{secretName}"
                 try:
-                    decoded = self.DECODER(content)
+                    with METRICS.timer("install_seconds", phase="decode"):
+                        decoded = self.DECODER(content)
                 except Exception as e:
                     logger.error(f"Can't decode secret in path {self._path} named {secretName} : {e!s}")
                     continue
                 try:
-                    if binary:
-                        with open(filepath, 'wb') as file:
-                            file.write(decoded)
-                    else:
-                        with open(filepath, 'wt') as file:
-                            file.write(decoded.decode("utf_8"))
-                except OSError as e:
+                    if not binary:
+                        # Text secret: must be valid utf-8
+                        decoded = decoded.decode("utf_8").encode("utf_8")
+                    self._writeFile(filepath, decoded, perm)
+                except (OSError, ValueError) as e:
                     logger.error(f"Can't save secret in {dir} with name {secretName} : {e!s}")
                     continue
                 self._secretFiles[filepath] = (
@@ -306,21 +349,16 @@ class envfile(SecretInstaller):
 
     def _install(self):
         filepath = f"{self._dirname}/{self._filename}"
+        # Get permission from parent & current secret
+        perm = self._perms
         try:
-            with open(filepath, 'wt') as file:
-                for k,v in self._secret["secret"]["data"].items():
-                    try:
-                        file.write(f"{k}={v}\n")
-                    except OSError as e:
-                        logger.error(f"Error when writing secret in file: {filepath}: {k} => {v} : {e!s}")
+            content = "".join(f"{k}={v}\n" for k,v in self._secret["secret"]["data"].items())
+            self._writeFile(filepath, content.encode("utf_8"), perm)
         except KeyError as e:
             logger.error(f"Can't get secret in {self._path} : {e!s}")
-        except OSError as e:
-            logger.error(f"Error when opening the file {filepath} : {e!s}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error when writing the file {filepath} : {e!s}")
         
-        # Get permission from parent & current secret
-        perm = copy.deepcopy(self._parentPerms)
-        perm.update(self._curPerms)
         self._secretFiles[filepath] = (
                 perm.get("user"),
                 perm.get("group"),
@@ -0,0 +1,208 @@
+import os
+import pwd
+import grp
+import json
+import stat
+import types
+import functools
+
+from ..lib.metrics import METRICS
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Distinct permissions kept by the caches, cleared on each sync
+CACHE_SIZE = 256
+
+# posix1e is imported only when a secret has extended permissions
+ACL_ERR_STR = {
+    "ACL_MULTI_ERROR": "The ACL contains multiple entries that have a tag type that may occur at most once.",
+    "ACL_DUPLICATE_ERROR": "The ACL contains multiple ACL_USER or ACL_GROUP entries with the same ID.",
+    "ACL_MISS_ERROR": "A required entry is missing.",
+    "ACL_ENTRY_ERROR": "The ACL contains an invalid entry tag type."
+}
+
+def acl_error(err: int) -> str:
+    import posix1e
+    for name, msg in ACL_ERR_STR.items():
+        if getattr(posix1e, name) == err:
+            return msg
+    return "Unknown error, should not appear"
+
+@functools.lru_cache(maxsize=1)
+def default_mode() -> int:
+    # Mode open() gives a new file: 0o666 without the umask bits.
+    # Read from /proc: setting the umask to read it races with other threads
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return 0o666 & ~int(line.split()[1], base=8)
+    except (OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def _resolve(name: str|None, getter, kind: str) -> int:
+    # Name (or numeric string) to id, -1 keeps the current owner
+    if name is None:
+        return -1
+    try:
+        return getter(name)[2]
+    except KeyError:
+        if str(name).isdigit():
+            return int(name)
+        logger.error(f"Unknown {kind} '{name}', ownership not changed")
+        return -1
+
+class PermPlan:
+    """
+    Owner, mode and ACL of a secretPerms entry, resolved once:
+    numeric uid/gid, int mode and a validated ACL.
+    """
+    __slots__ = ("uid", "gid", "mode", "acl", "acl_text")
+
+    def __init__(self, user: str|None = None, group: str|None = None,
+                 perms: str|None = None, extended: str|None = None):
+        self.uid = _resolve(user, pwd.getpwnam, "user")
+        self.gid = _resolve(group, grp.getgrnam, "group")
+        self.mode = None
+        if perms is not None:
+            try:
+                self.mode = int(perms, base=8)
+            except ValueError as e:
+                logger.error(f"Can't convert {perms} to integer value. perm should be 0oXXX in octal mode: {e!s}")
+        self.acl = None
+        self.acl_text = None
+        if extended:
+            self._compile_acl(extended)
+
+    def _compile_acl(self, extended: str):
+        import posix1e
+        try:
+            acl = posix1e.ACL(text=extended)
+        except OSError as e:
+            logger.error(f"'{extended}' is not correct extended permission: {e!s}")
+            return
+        if not acl.valid():
+            logger.error(f"Extended permission '{extended}' not valid:")
+            err = acl.check()
+            sErr = acl_error(err[0])
+            logger.error(f"Pos {err[1]}: {sErr}")
+            return
+        self.acl = acl
+        self.acl_text = acl.to_any_text()
+
+    def apply_fd(self, fd: int, path: str, current: os.stat_result|None = None) -> None:
+        # Owner, mode and ACL of a new file, set on its fd before it replaces path.
+        # What the plan leaves unset is kept from current, the replaced file
+        mode = self.mode
+        if mode is None:
+            mode = default_mode() if current is None else stat.S_IMODE(current.st_mode)
+        uid, gid = self.uid, self.gid
+        if current is not None:
+            uid = current.st_uid if uid == -1 else uid
+            gid = current.st_gid if gid == -1 else gid
+        if uid != -1 or gid != -1:
+            try:
+                with METRICS.timer("install_seconds", phase="chown"):
+                    os.fchown(fd, uid, gid)
+            except OSError as e:
+                if self.uid != -1 or self.gid != -1:
+                    logger.error(f"Can't set permission to file {path} : {e!s}")
+        os.fchmod(fd, mode)
+        if self.acl is not None:
+            try:
+                with METRICS.timer("install_seconds", phase="acl"):
+                    self.acl.applyto(fd)
+            except OSError as e:
+                logger.error(f"Can't apply ACL({self.acl_text}) to file '{path}")
+
+    def apply(self, path: str) -> bool:
+        # Change only what differs from the file current state
+        # Return True if something was changed
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"Can't set permission to file {path} : {e!s}")
+            return False
+        changed = False
+        uid = -1 if self.uid in (-1, st.st_uid) else self.uid
+        gid = -1 if self.gid in (-1, st.st_gid) else self.gid
+        if uid != -1 or gid != -1:
+            try:
+                with METRICS.timer("install_seconds", phase="chown"):
+                    os.chown(path, uid, gid)
+                changed = True
+            except OSError as e:
+                logger.error(f"Can't set permission to file {path} : {e!s}")
+
+        acl_differs = False
+        if self.acl is not None:
+            import posix1e
+            try:
+                with METRICS.timer("install_seconds", phase="acl"):
+                    acl_differs = posix1e.ACL(file=path).to_any_text() != self.acl_text
+            except OSError:
+                acl_differs = True
+
+        if self.mode is not None:
+            cur = stat.S_IMODE(st.st_mode)
+            # With an ACL, rwx bits are owned by the ACL entries (group bits are its mask)
+            mask = 0o7000 if self.acl is not None and not acl_differs else 0o7777
+            if cur & mask != self.mode & mask:
+                try:
+                    with METRICS.timer("install_seconds", phase="chmod"):
+                        os.chmod(path, self.mode)
+                    changed = True
+                    # chmod rewrites the ACL mask
+                    acl_differs = self.acl is not None
+                except OSError as e:
+                    logger.error(f"Can't change perm on file {path}: {e!s}")
+
+        if acl_differs:
+            try:
+                with METRICS.timer("install_seconds", phase="acl"):
+                    self.acl.applyto(path)
+                changed = True
+            except OSError as e:
+                logger.error(f"Can't apply ACL({self.acl_text}) to file '{path}")
+        return changed
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_perms(user: str|None = None, group: str|None = None,
+                  perms: str|None = None, extended: str|None = None) -> PermPlan:
+    # One plan per distinct secretPerms entry, shared by every file using it
+    return PermPlan(user, group, perms, extended)
+
+# Shared by every secret without secretPerms
+EMPTY_PERMS = types.MappingProxyType({})
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_perms(strJson: str|None):
+    # Read-only secretPerms, parsed once per distinct JSON string and shared
+    # by every secret using it. Invalid JSON raises ValueError (not cached)
+    if strJson is None:
+        return EMPTY_PERMS
+    return json.loads(strJson, object_hook=types.MappingProxyType)
+
+def _parse_or_empty(strJson: str|None):
+    try:
+        return parse_perms(strJson)
+    except ValueError:
+        return EMPTY_PERMS
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def merge_perms(parent: str|None, cur: str|None):
+    # secretPerms of a secret over those of its parent, merged once per
+    # distinct pair. Invalid JSON counts as empty (reported by the installer)
+    return types.MappingProxyType({**_parse_or_empty(parent), **_parse_or_empty(cur)})
+
+def clear_caches() -> None:
+    # Resolve users and groups again: they may have changed since the last sync.
+    # Parsed secretPerms come from secrets: don't keep them across syncs either
+    compile_perms.cache_clear()
+    default_mode.cache_clear()
+    parse_perms.cache_clear()
+    merge_perms.cache_clear()
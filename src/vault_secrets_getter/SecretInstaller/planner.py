@@ -0,0 +1,126 @@
+import os
+
+from .perms import compile_perms
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class InstallPlanner:
+    """
+    Install many SecretInstaller at once.
+
+    Planning pass (add): each outdated installer declares its directories.
+    Execution pass (execute): create each distinct directory once, write the
+    files, then apply each distinct path permission once, in directory order.
+    When several installers set permissions of the same path, the last one
+    wins, as when installing them one after the other.
+
+    Streaming (install, then finish): each installer is planned, its files
+    written, its permissions applied and its version saved as soon as it
+    comes. finish only settles paths several installers set permissions
+    of: the last one in the order given to finish wins.
+    """
+    def __init__(self):
+        self._dirs = set()
+        self._created = set()
+        self._perms = {}
+        self._ranked = []
+        self._installers = []
+        # Permissions applied so far, by path
+        self._applied = {}
+        # A streamed installer has been installed
+        self._changed = False
+
+    def mkdir(self, path: str) -> None:
+        self._dirs.add(path)
+
+    def perm(self, path: str, spec: tuple) -> None:
+        self._perms[path] = spec
+
+    def add(self, installer) -> bool:
+        # Return True if the installer has a new version to install
+        if not installer.prepare(self):
+            return False
+        self._installers.append(installer)
+        return True
+
+    def install(self, installer, key=None) -> bool:
+        # Streaming: write the files of one installer now
+        # key: rank of the installer in the order given to finish
+        if not self.add(installer):
+            return False
+        self._makedirs()
+        if not self._write(installer, key):
+            return False
+        # Complete now, even if the walk fails before finish
+        for path, spec in installer._secretFiles.items():
+            self._apply(path, spec)
+        installer._saveVersion()
+        self._installers.remove(installer)
+        self._changed = True
+        # Installed: only its version is needed from now on
+        installer.release()
+        return True
+
+    def _apply(self, path: str, spec: tuple) -> None:
+        if self._applied.get(path) == spec:
+            return
+        compile_perms(*spec).apply(path)
+        self._applied[path] = spec
+
+    def _makedirs(self) -> None:
+        for path in sorted(self._dirs - self._created):
+            try:
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Can't create directory {path} : {e!s}")
+        self._created |= self._dirs
+        self._dirs.clear()
+
+    def _write(self, installer, key=None) -> bool:
+        # A failing installer is dropped, the others are still installed
+        try:
+            installer._install()
+        except Exception as e:
+            logger.error(f"Can't install secret {installer._path} : {e!s}")
+            self._installers.remove(installer)
+            return False
+        # extraPerms first, then the files of the installer
+        for path, spec in installer._secretFiles.items():
+            self._ranked.append((key, path, spec))
+        return True
+
+    def execute(self) -> bool:
+        # Return True if at least one secret has been installed
+        self._makedirs()
+        for installer in list(self._installers):
+            self._write(installer)
+        return self.finish()
+
+    def finish(self, order: list|None = None) -> bool:
+        # Apply permissions and save versions of the written installers,
+        # settle paths shared by streamed installers
+        # Return True if at least one secret has been installed
+        if order is not None:
+            rank = {key: i for i, key in enumerate(order)}
+            # Stable: files of one installer keep their order
+            self._ranked.sort(key=lambda r: rank.get(r[0], len(rank)))
+        for key, path, spec in self._ranked:
+            self.perm(path, spec)
+
+        for path in sorted(self._perms):
+            self._apply(path, self._perms[path])
+
+        for installer in self._installers:
+            installer._saveVersion()
+
+        changed = self._changed or len(self._installers) > 0
+        self._dirs.clear()
+        self._created.clear()
+        self._perms.clear()
+        self._ranked.clear()
+        self._installers.clear()
+        self._applied.clear()
+        self._changed = False
+        return changed
@@ -0,0 +1,97 @@
+import os
+import json
+import tempfile
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+One file per SECRET_BASE_DIR holding the installed version of every secret:
+{"format": 1, "entries": {"<meta key>": {"path": "...", "version": 3, "created_time": "...", "digest": "sha256:..."}}}
+"""
+class StateIndex:
+    FORMAT = 1
+    FILENAME = ".vault-secrets-getter.state"
+    CONFIG_KEY = "SECRET_STATE_FILE"
+
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def filepath_for(cls, config, base: str|None = None) -> str:
+        # Keys are absolute paths: one SECRET_STATE_FILE can serve all base dirs
+        filepath = config.get(cls.CONFIG_KEY)
+        if filepath is None:
+            base = base or config["SECRET_BASE_DIR"] or "/run/secrets"
+            filepath = os.path.join(base, cls.FILENAME)
+        return filepath
+
+    @classmethod
+    def from_config(cls, config, base: str|None = None) -> "StateIndex":
+        return cls(cls.filepath_for(config, base))
+
+    @property
+    def filepath(self) -> str:
+        return self._filepath
+
+    def _load(self) -> dict:
+        # Read the whole index once, on first access
+        if self._entries is not None:
+            return self._entries
+        with self._lock:
+            if self._entries is None:
+                entries = {}
+                try:
+                    with open(self._filepath, "r") as f:
+                        content = json.load(f)
+                    if content.get("format") == self.FORMAT:
+                        entries = content.get("entries", {})
+                    else:
+                        logger.error(f"Unknown format of state file {self._filepath}, ignore it")
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError) as e:
+                    logger.error(f"Can't read state file {self._filepath} : {e!s}")
+                self._entries = entries
+        return self._entries
+
+    def get(self, key: str) -> dict|None:
+        return self._load().get(key)
+
+    def set(self, key: str, entry: dict) -> None:
+        entries = self._load()
+        with self._lock:
+            if entries.get(key) != entry:
+                entries[key] = entry
+                self._dirty = True
+
+    def items(self):
+        return list(self._load().items())
+
+    def commit(self) -> bool:
+        # Atomically replace the state file, only if something changed
+        with self._lock:
+            if not self._dirty:
+                return False
+            dirname = os.path.dirname(self._filepath) or "."
+            try:
+                os.makedirs(dirname, exist_ok=True)
+                fd, tmppath = tempfile.mkstemp(dir=dirname, prefix=".state.")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        json.dump({"format": self.FORMAT, "entries": self._entries}, f, separators=(",", ":"))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmppath, self._filepath)
+                except BaseException:
+                    os.unlink(tmppath)
+                    raise
+            except OSError as e:
+                logger.error(f"Can't save state file {self._filepath} : {e!s}")
+                return False
+            self._dirty = False
+            return True
@@ -1 +1,4 @@
-from .main import main
+def main():
+    # Import the CLI on call: importing the package stays cheap
+    from .main import main as _main
+    return _main()
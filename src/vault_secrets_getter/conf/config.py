@@ -9,11 +9,62 @@ class Config(BaseConfig):
     VAULT_TOKEN: Optional[str] = None
     VAULT_ROLE_ID: Optional[str] = None
     VAULT_ROLE_SECRET: Optional[str] = None
+    VAULT_SECRET_ID: Optional[str] = None
     VAULT_JWT_ROLE: Optional[str] = None
     VAULT_JWT_KEY: Optional[str] = None
     VAULT_AUTHPATH: Optional[str] = None
     VAULT_SECRETS_MOUNTPOINT: Optional[str] = None
+    # Prefix of the secret paths read from this Vault
+    VAULT_PATH_PREFIX: Optional[str] = None
+    # Several Vaults synced at the same time into the same local dirs, each
+    # item overriding VAULT_* keys of this config, e.g.
+    # [{"VAULT_ADDRESS": "https://vault-a", "VAULT_ROLE_ID": "...", "VAULT_SECRET_ID": "...", "VAULT_PATH_PREFIX": "hosts"},
+    #  {"VAULT_ADDRESS": "https://vault-b", "VAULT_SECRETS_MOUNTPOINT": "shared"}]
+    # When several sources install the same file, the first one wins
+    VAULT_SOURCES: list = []
+    # Reuse the token of an approle / JWT login in the next runs, until it
+    # expires or is revoked: path of a 0600 cache file (None: login on each run)
+    VAULT_TOKEN_CACHE: Optional[str] = None
+    # Renew (or login again) when the token expires in less than this (seconds)
+    VAULT_TOKEN_RENEW_MARGIN: int = 60
+    # Read metadata first and skip secret data already installed locally
+    VAULT_VERSION_GATED: bool = False
+    # Trust cached folder listings for this many seconds (0: list on every sync).
+    # A folder is listed again sooner when one of its secrets changes version.
+    VAULT_LISTING_TTL: int = 0
+    # Listing cache (default: <SECRET_BASE_DIR>/.vault-secrets-getter.listing)
+    VAULT_LISTING_FILE: Optional[str] = None
     SECRET_BASE_DIR: Optional[str] = None
+    # Index of installed versions (default: <SECRET_BASE_DIR>/.vault-secrets-getter.state)
+    SECRET_STATE_FILE: Optional[str] = None
+    # fsync of written secrets: "never", "file" or "always" (file and directory)
+    SECRET_FSYNC: str = "file"
+    # Fetched secrets waiting to be installed (0: no limit), the walk waits above
+    SECRET_PIPELINE_BUFFER: int = 64
+    # Number of workers fetching the secret tree (1 = sequential walk)
+    VAULT_CONCURRENCY: int = 1
+    # Vault reads kept during a sync, for aliases and paths read twice (0: no limit)
+    VAULT_RUN_CACHE_SIZE: int = 1024
+    # "hvac" (blocking) or "async" (httpx, needs the async extra)
+    VAULT_BACKEND: str = "hvac"
+    # Maximum number of requests in flight with the async backend
+    VAULT_ASYNC_CONCURRENCY: int = 100
+    # HTTP connection pool of the hvac backend
+    VAULT_POOL_CONNECTIONS: int = 10
+    VAULT_POOL_MAXSIZE: int = 10
+    # Request timeout (seconds)
+    VAULT_TIMEOUT: int = 30
+    # TCP keep-alive on pooled connections, reuse TLS connections across syncs
+    VAULT_KEEPALIVE: bool = True
+    # Adaptive concurrency: grow while requests answer within VAULT_TARGET_LATENCY
+    # (seconds), halve on 429, 503 or timeout, never below VAULT_MIN_CONCURRENCY
+    VAULT_TARGET_LATENCY: float = 0.5
+    VAULT_MIN_CONCURRENCY: int = 1
+    # Retries of overloaded requests, jittered exponential backoff (seconds)
+    # honoring Retry-After
+    VAULT_RETRIES: int = 5
+    VAULT_RETRY_BACKOFF: float = 0.5
+    VAULT_RETRY_MAX_DELAY: float = 30
     INSTALLER_ALIAS: dict = {
         "default": ".SecretInstaller.base.log",
         "x509": ".SecretInstaller.Certs.x509",
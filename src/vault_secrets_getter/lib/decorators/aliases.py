@@ -51,20 +51,21 @@ class alias_arg0:
             Callable: the decorated method
 
         """
-        self.__aliases = getattr(instance, self.alias_attr)
-        if self.__aliases:
+        # Local: the decorator object is shared by every call and thread
+        aliases = getattr(instance, self.alias_attr)
+        if aliases:
             if isinstance(args[0], list):
-                if args[0][0] in self.__aliases:
+                if args[0][0] in aliases:
                     if __debug__:
                         logger.debug("Aliased arg '%s' changed into '%s'",
-                                     args[0][0], self.__aliases[args[0][0]])
-                    return wrapped(self.__aliases[args[0][0]], *args[1:],
+                                     args[0][0], aliases[args[0][0]])
+                    return wrapped(aliases[args[0][0]], *args[1:],
                                    **kwargs)
             elif isinstance(args[0], str):
-                if args[0] in self.__aliases:
+                if args[0] in aliases:
                     if __debug__:
                         logger.debug("Aliased arg '%s' changed into '%s'",
-                                     args[0], self.__aliases[args[0]])
-                    return wrapped(self.__aliases[args[0]], *args[1:],
+                                     args[0], aliases[args[0]])
+                    return wrapped(aliases[args[0]], *args[1:],
                                    **kwargs)
         return wrapped(*args, **kwargs)
@@ -5,53 +5,195 @@ Decorator for memoization.
 Works on instance methods, not functions.
 Requires args and kwargs to be hashable.
 
+Each instance gets one cache per decorated method. Caches are thread-safe,
+optionally bounded (LRU eviction) and expiring (TTL), and concurrent calls
+with the same arguments share a single computation.
+
 """
-from typing import Callable, Any
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Any, Optional
 import wrapt
 
 if __debug__:
     import logging
     logger = logging.getLogger(__name__)
 
+_CACHES_ATTR = "_memoize_caches"
+_CACHES_LOCK = threading.Lock()
+
+
+class _InFlight:
+    """Computation in progress, awaited by concurrent callers."""
+
+    __slots__ = ("owner", "done", "value", "error")
+
+    def __init__(self) -> None:
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class MemoizeCache:
+    """Cache of one method on one instance.
+
+    Args:
+        maxsize (int): maximum number of entries, least recently used are
+            evicted first. None for unbounded.
+        ttl (float): seconds an entry stays valid. None for no expiry.
+
+    """
+
+    def __init__(self, maxsize: Optional[int] = None,
+                 ttl: Optional[float] = None) -> None:
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Any) -> tuple:
+        """Return (True, value) of a valid entry, (False, None) otherwise."""
+        try:
+            value, expires = self._entries[key]
+        except KeyError:
+            return False, None
+        if expires is not None and time.monotonic() >= expires:
+            del self._entries[key]
+            self.evictions += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Any, value: Any) -> None:
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Return the cached value of key, or compute it once.
+
+        Concurrent callers of a key being computed wait for that result.
+        Errors are raised to every waiting caller and are not cached.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            flight = self._inflight.get(key)
+            # Recursive call from the computing thread: do not wait on itself
+            owner = flight is None or flight.owner == threading.get_ident()
+            if owner:
+                self.misses += 1
+                flight = self._inflight[key] = _InFlight()
+            else:
+                # Served by the computation in progress
+                self.hits += 1
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = compute()
+        except BaseException as err:
+            flight.error = err
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+            return flight.value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
 
-@wrapt.decorator
-def memoize(wrapped: Callable, instance: Any,
-            args: Any, kwargs: Any) -> Any:
+    def clear(self) -> None:
+        """Drop every entry, keep the counters."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hits, misses, evictions and current size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "size": len(self._entries)}
+
+
+def _cache_of(instance: Any, wrapped: Callable, maxsize: Optional[int],
+              ttl: Optional[float]) -> MemoizeCache:
+    """Return the cache of wrapped on instance, create it if needed."""
+    caches = getattr(instance, _CACHES_ATTR, None)
+    if caches is None:
+        with _CACHES_LOCK:
+            caches = instance.__dict__.setdefault(_CACHES_ATTR, {})
+    cache = caches.get(wrapped)
+    if cache is None:
+        with _CACHES_LOCK:
+            cache = caches.setdefault(wrapped, MemoizeCache(maxsize, ttl))
+    return cache
+
+
+def memoize_stats(instance: Any) -> dict:
+    """Return counters of every memoized method of instance, by name.
+
+    Args:
+        instance (Any): the instance holding the caches
+
+    Returns:
+        dict: {method qualified name: {hits, misses, evictions, size}}
+
+    """
+    caches = getattr(instance, _CACHES_ATTR, {})
+    return {wrapped.__qualname__: cache.stats()
+            for wrapped, cache in list(caches.items())}
+
+
+def memoize(wrapped: Optional[Callable] = None, *,
+            maxsize: Optional[int] = None,
+            ttl: Optional[float] = None) -> Any:
     """Find cached value if it exists, else call method.
 
-    If cache doesn't exist, create a dedicated dictionnary.
-    To make the stored values retrievable, we store the method, it's args
-    and it's kwargs. This tuple is used as a key, and is the reason why
+    Usable bare (@memoize, unbounded) or with options
+    (@memoize(maxsize=256, ttl=3600)).
+    To make the stored values retrievable, we key them by the method args
+    and its kwargs. kwargs keys are guaranteed to be strings (they are
+    keywords of methods), so a tuple of the sorted key, value couples
+    recognizes the same kwargs on multiple calls. This is the reason why
     args and kwargs must be hashable.
 
     Args:
-        wrapped (Callable): the wrapped method
-        instance (Any): the instance in which is defined the wrapped method
-        args (Any): arguments to be used by memoized method
-        kwargs (Any): kw-arguments to be used by memoized method.
-            This comes in the form of a dictionnary on which keys are
-            guaranteed to be strings (they are keywords of methods). Thus
-            one can leverage this to build a tuple of the sorted key, value
-            couples on the keys. This allows to guarantee that the same
-            kwargs on multiple calls are recognized as refering to the same
-            cached value, and avoid the issue of unordered data structures.
+        wrapped (Callable): the method, when used without options
+        maxsize (int): maximum number of cached values per instance, least
+            recently used are evicted first. None for unbounded.
+        ttl (float): seconds a cached value stays valid. None for no expiry.
 
     Returns:
-     Any: the output of the memoized method, be it from the cache or
-     by calling the method.
+     Any: the decorated method, or a decorator when called with options.
 
     """
-    try:
-        cache = instance.__cache
-    except AttributeError:
-        cache = instance.__cache = {}
-    key = (wrapped, args, tuple(sorted(kwargs.items())))
-    try:
-        res = cache[key]
-        if __debug__:
-            logger.debug("Accessing cached value of '%s'", wrapped)
-    except KeyError:
-        res = cache[key] = wrapped(*args, **kwargs)
+    if wrapped is None:
+        return functools.partial(memoize, maxsize=maxsize, ttl=ttl)
+
+    @wrapt.decorator
+    def wrapper(wrapped: Callable, instance: Any,
+                args: Any, kwargs: Any) -> Any:
+        cache = _cache_of(instance, wrapped, maxsize, ttl)
+        key = (args, tuple(sorted(kwargs.items())))
         if __debug__:
-            logger.debug("Storing new value of '%s' in cache", wrapped)
-    return res
+            logger.debug("Accessing cache of '%s'", wrapped)
+        return cache.get(key, lambda: wrapped(*args, **kwargs))
+
+    return wrapper(wrapped)
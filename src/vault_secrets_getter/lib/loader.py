@@ -13,6 +13,10 @@ import types
 from .decorators.memoize import memoize
 from .decorators.aliases import alias_arg0
 
+# Modules and classes kept per loader: names come from secrets, so the
+# cache must stay bounded in a long-running process
+CACHE_SIZE = 256
+
 if __debug__:
     import logging
     logger = logging.getLogger(__name__)
@@ -123,24 +127,28 @@ class LoaderFiltered(Loader):
                  package: Optional[str] = None) -> None:
         """Store filters in attribute, pass along alias to parent class."""
         super().__init__(alias=alias, package=package)
-        self._filters = filters if filters else []
+        self._filters = frozenset(filters if filters else [])
         # super().__init__(alias=alias)
 
-    @memoize
+    def allows(self, name: str) -> bool:
+        """Return True if the module or class name passes the filters."""
+        return name in self._filters
+
+    @memoize(maxsize=CACHE_SIZE)
     @alias_arg0(alias_attr="_Loader__alias")
     def get_module(self, module_name: str) -> types.ModuleType:
         """Wrap parent class method and adds a simple filtering operation."""
-        if module_name not in self._filters:
+        if not self.allows(module_name):
             raise ImportError(
                 "Module '%s' not in authorized module" % (module_name))
 
         return Loader.get_module(self, module_name)
 
-    @memoize
+    @memoize(maxsize=CACHE_SIZE)
     @alias_arg0(alias_attr="_Loader__alias")
     def get_class(self, total_class_name: str) -> Any:
         """Wrap parent class method and adds a simple filtering operation."""
-        if total_class_name not in self._filters:
+        if not self.allows(total_class_name):
             raise ImportError(
                 "Class '%s' not in authorized class" % (total_class_name))
         return Loader.get_class(self, total_class_name)
@@ -154,30 +162,35 @@ class LoaderREFiltered(Loader):
                  package: Optional[str] = None) -> None:
         """Store filters in attribute, pass along alias to parent class.
 
-        Transform raw strings to compiled regexp and store it in list.
+        Transform raw strings to a single compiled regexp matching any of
+        them, so a name is checked in one pass.
         """
         super().__init__(alias=alias, package=package)
-        self._filters: list = []
         filters = filters if filters else []
-        for filt in filters:
-            self._filters.append(re.compile(filt))
+        self._filter: Optional[re.Pattern] = None
+        if filters:
+            self._filter = re.compile(
+                "|".join("(?:%s)" % (filt) for filt in filters))
+
+    def allows(self, name: str) -> bool:
+        """Return True if the module or class name matches a filter."""
+        return self._filter is not None and \
+            self._filter.match(name) is not None
 
-    @memoize
+    @memoize(maxsize=CACHE_SIZE)
     @alias_arg0(alias_attr="_Loader__alias")
     def get_module(self, module_name: str) -> types.ModuleType:
         """Wrap parent class method and adds a regexp filtering operation."""
-        for filt in self._filters:
-            if filt.match(module_name):
-                return Loader.get_module(self, module_name)
+        if self.allows(module_name):
+            return Loader.get_module(self, module_name)
         raise ImportError(
             "Module '%s' not in authorized module" % (module_name))
 
-    @memoize
+    @memoize(maxsize=CACHE_SIZE)
     @alias_arg0(alias_attr="_Loader__alias")
     def get_class(self, total_class_name: str) -> Any:
         """Wrap parent class method and adds a regexp filtering operation."""
-        for filt in self._filters:
-            if filt.match(total_class_name):
-                return Loader.get_class(self, total_class_name)
+        if self.allows(total_class_name):
+            return Loader.get_class(self, total_class_name)
         raise ImportError(
             "Class '%s' not in authorized class" % (total_class_name))
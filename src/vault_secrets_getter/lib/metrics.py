@@ -0,0 +1,198 @@
+"""
+Contains the process-wide metrics.
+
+Counters and latency histograms, labelled by phase, cumulative for the life
+of the process (a daemon keeps adding to them), exported as JSON or in the
+Prometheus text format (textfile collector).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Upper bounds (seconds) of latency buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Count, sum and bucket counts of observed durations."""
+
+    __slots__ = ("count", "sum", "buckets")
+
+    def __init__(self) -> None:
+        """Create an empty histogram."""
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, value: float) -> None:
+        """Add one observation."""
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+    def snapshot(self) -> dict:
+        """Return count, sum and cumulative bucket counts."""
+        cumulative, total = {}, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            cumulative[str(bound)] = total
+        cumulative["+Inf"] = self.count
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms.
+
+    Each metric is identified by a name and optional labels, e.g.
+    inc("vault_bytes_total", 512, op="read").
+    """
+
+    def __init__(self, prefix: str = "vault_secrets_getter") -> None:
+        """Create an empty registry, names exported with prefix."""
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: dict = {}
+        self._gauges: dict = {}
+        self._histograms: dict = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add value to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge."""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def max(self, name: str, value: float, **labels: str) -> None:
+        """Raise a gauge to value if it is lower."""
+        key = self._key(name, labels)
+        with self._lock:
+            if value > self._gauges.get(key, float("-inf")):
+                self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Add a duration (seconds) to a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block in a histogram."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def reset(self) -> None:
+        """Forget every metric."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Return every metric as plain data, for JSON."""
+        def entries(metrics: dict, value) -> list:
+            return [{"name": name, "labels": dict(labels), **value(v)}
+                    for (name, labels), v in sorted(metrics.items())]
+        with self._lock:
+            return {
+                "counters": entries(self._counters, lambda v: {"value": v}),
+                "gauges": entries(self._gauges, lambda v: {"value": v}),
+                "histograms": entries(self._histograms,
+                                      lambda v: v.snapshot()),
+            }
+
+    def to_json(self) -> str:
+        """Return the snapshot as JSON."""
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        def labelstr(labels: dict, **extra: str) -> str:
+            items = {**labels, **extra}
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}"
+
+        lines = []
+        snap = self.snapshot()
+        for kind, mtype in (("counters", "counter"), ("gauges", "gauge")):
+            typed = set()
+            for entry in snap[kind]:
+                name = f"{self.prefix}_{entry['name']}"
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} {mtype}")
+                lines.append(f"{name}{labelstr(entry['labels'])} {entry['value']}")
+        typed = set()
+        for entry in snap["histograms"]:
+            name = f"{self.prefix}_{entry['name']}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in entry["buckets"].items():
+                lines.append(f"{name}_bucket{labelstr(entry['labels'], le=bound)} {count}")
+            lines.append(f"{name}_sum{labelstr(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{labelstr(entry['labels'])} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filepath: str, fmt: str = "json") -> None:
+        """Atomically replace filepath with the metrics (json or prometheus).
+
+        Atomic rename: the textfile collector never reads a partial file.
+        """
+        content = self.to_prometheus() if fmt == "prometheus" else self.to_json()
+        dirname = os.path.dirname(filepath) or "."
+        fd, tmppath = tempfile.mkstemp(dir=dirname, prefix=".metrics.")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(content)
+            os.chmod(tmppath, 0o644)
+            os.replace(tmppath, filepath)
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+
+
+# Process-wide registry used by the clients, the walk and the installers
+METRICS = Metrics()
+
+
+def record_request(method: str, url: str, seconds: float, size: int) -> None:
+    """Observe latency and response size of one Vault request, by operation.
+
+    Shared by the hvac and httpx clients: the operation is told from the
+    Vault HTTP API url.
+    """
+    if "/v1/auth/" in url:
+        op = "auth"
+    elif method == "LIST" or "list=true" in url:
+        op = "list"
+    elif "/metadata/" in url:
+        op = "metadata"
+    elif "/data/" in url:
+        op = "read"
+    else:
+        op = "other"
+    METRICS.observe("vault_request_seconds", seconds, op=op)
+    METRICS.inc("vault_response_bytes_total", size, op=op)
@@ -0,0 +1,90 @@
+"""
+Contains the installer registry.
+
+Resolve a secret type to its class once, then dispatch with a dict lookup.
+"""
+import threading
+import types
+from typing import Any
+
+from .decorators.memoize import memoize_stats
+from .loader import Loader
+
+if __debug__:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class InstallerRegistry:
+    """Frozen map of type names to classes, on top of a filtering loader.
+
+    Aliases are copied once at creation into a read-only mapping. A class is
+    imported through the loader (and its filters) the first time its type is
+    requested, so only modules of types actually seen are imported. Each
+    later call is a single dict lookup, safe to call from many threads.
+    """
+
+    def __init__(self, loader: Loader) -> None:
+        """Freeze the aliases of the loader.
+
+        Args:
+            loader (Loader): loader enforcing the filters, used on the first
+                request of each type.
+
+        """
+        self._loader = loader
+        alias = getattr(loader, "_Loader__alias") or {}
+        self._alias = types.MappingProxyType(dict(alias))
+        self._classes: dict = {}
+        self._lock = threading.Lock()
+        # Aliases rejected by the filters are known without importing
+        allows = getattr(loader, "allows", None)
+        if allows is not None:
+            for type_name, total_class_name in self._alias.items():
+                if not allows(total_class_name):
+                    self._classes[type_name] = ImportError(
+                        "Class '%s' not in authorized class" % (total_class_name))
+
+    def cache_stats(self) -> dict:
+        """Return counters of the memoized methods of the loader, by name."""
+        return {f"loader.{name}": stats
+                for name, stats in memoize_stats(self._loader).items()}
+
+    @property
+    def alias(self) -> types.MappingProxyType:
+        """Return the read-only alias map."""
+        return self._alias
+
+    def _resolve(self, type_name: str) -> Any:
+        """Import the class of a type, or return the ImportError raised."""
+        total_class_name = self._alias.get(type_name, type_name)
+        try:
+            return self._loader.get_class(total_class_name)
+        except ImportError as err:
+            return err
+
+    def get_class(self, type_name: str) -> Any:
+        """Return the class registered for a type (or alias).
+
+        Raises:
+            ImportError: the class is not allowed by the filters or cannot
+                be imported.
+
+        """
+        try:
+            cls = self._classes[type_name]
+        except KeyError:
+            with self._lock:
+                cls = self._classes.get(type_name)
+                if cls is None:
+                    cls = self._classes[type_name] = self._resolve(type_name)
+                    if __debug__:
+                        logger.debug("Registered type '%s' as %s",
+                                     type_name, cls)
+        if isinstance(cls, ImportError):
+            raise ImportError(*cls.args)
+        return cls
+
+    def get_instance(self, type_name: str, *args: Any, **kwargs: Any) -> Any:
+        """Instantiate the class of a type with args and kwargs."""
+        return self.get_class(type_name)(*args, **kwargs)
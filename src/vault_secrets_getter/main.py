@@ -1,20 +1,229 @@
 import argparse
+import json
 import logging
-import logging.config
 
 import os
+import random
+import signal
 import sys
+import threading
+import time
 
 from .conf.config import Config
+from .lib.metrics import METRICS
 
-from .SecretClient.Vault import VaultClient
-from .SecretClient.Secrets import Secret
-
-class VaultSecret(Secret, VaultClient):
-    pass
+from .SecretInstaller.planner import InstallPlanner
+from .SecretInstaller.perms import clear_caches
+from .SecretClient.sources import Source, SourceMerge
 
 logger = logging.getLogger(__name__)
 
+def __getattr__(name):
+    # VaultSecret used to be defined here, keep it importable
+    if name == "VaultSecret":
+        from .SecretClient.Vault import VaultSecret
+        return VaultSecret
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_secret(cfg, states=None, scope=""):
+    # Vault clients (hvac, requests or httpx) are imported once the
+    # arguments and the config are loaded: --help and errors stay fast
+    kwargs = {} if states is None else {"states": states}
+    if scope:
+        kwargs["scope"] = scope
+    if cfg["VAULT_BACKEND"] == "async":
+        from .SecretClient.AsyncVault import AsyncVaultSecret
+        return AsyncVaultSecret(config=cfg, **kwargs)
+    from .SecretClient.Vault import VaultSecret
+    return VaultSecret(config=cfg, **kwargs)
+
+def get_sources(cfg) -> list:
+    # One client per VAULT_SOURCES item (the config itself without), each
+    # with its own connection pool, all sharing the local state indexes.
+    # Listings of each source are kept apart, scoped by its name
+    configs = [cfg]
+    if cfg.get("VAULT_SOURCES"):
+        configs = []
+        for item in cfg["VAULT_SOURCES"]:
+            conf = Config(cfg.root_path, defaults=cfg, load_me=False)
+            conf.from_mapping(item)
+            configs.append(conf)
+    states = {}
+    sources = []
+    for conf in configs:
+        loop = None
+        if conf["VAULT_BACKEND"] == "async":
+            import asyncio
+            loop = asyncio.new_event_loop()
+        scope = Source.name_of(conf) if cfg.get("VAULT_SOURCES") else ""
+        sources.append(Source(get_secret(conf, states, scope), conf, loop))
+    return sources
+
+def get_entries(args) -> list:
+    # List of (secret path, local dir) to sync, from --manifest or the
+    # repeated --secret-path/--localdir-secret flags
+    # Raise ValueError (OSError for an unreadable manifest) on invalid entries
+    entries = []
+    manifest = getattr(args, "manifest", None)
+    if manifest is not None:
+        with open(manifest, "r") as f:
+            content = json.load(f)
+        if not isinstance(content, list):
+            raise ValueError(f"Manifest {manifest} must be a JSON list")
+        for n, entry in enumerate(content):
+            if not isinstance(entry, dict) or not isinstance(entry.get("path"), str) \
+                    or not isinstance(entry.get("localdir"), str):
+                raise ValueError(f"Entry {n} of manifest {manifest} needs a \"path\" and a \"localdir\"")
+            entries.append((entry["path"], entry["localdir"]))
+    paths = args.secret_path or []
+    dirs = args.localdir_secret or []
+    if isinstance(paths, str):
+        paths = [paths]
+    if isinstance(dirs, str):
+        dirs = [dirs]
+    if len(dirs) == 1:
+        # One local dir for every secret path
+        dirs = dirs * len(paths)
+    if len(paths) != len(dirs):
+        raise ValueError("Each --secret-path needs its --localdir-secret")
+    entries.extend(zip(paths, dirs))
+    return entries
+
+def sync(sources, entries) -> bool:
+    # Fetch and install all entries once, return True if anything changed
+    # Secrets are installed while the trees of all sources are being fetched
+    clear_caches()
+    start = time.monotonic()
+    first = None
+    planner = InstallPlanner()
+    order = []
+    errors = []
+    try:
+        try:
+            with METRICS.timer("sync_seconds", phase="stream"):
+                for i, (path, base) in enumerate(entries):
+                    merged = SourceMerge(sources, path, base)
+                    for j,p,v in merged:
+                        if planner.install(v, key=(i, j, p)) and first is None:
+                            first = time.monotonic() - start
+                    order.extend((i, j, p) for j,p in merged.keys)
+                    errors.extend(e for j,e in merged.errors)
+            if errors:
+                # Other sources are installed: still fail the sync
+                raise errors[0]
+        finally:
+            # Also when a walk fails: keep what has been installed so far
+            with METRICS.timer("sync_seconds", phase="install"):
+                changed = planner.finish(order)
+            for source in sources:
+                source.secret.commit_state()
+        if first is not None:
+            METRICS.observe("sync_seconds", first, phase="first_install")
+    finally:
+        # Per-run caches hold secret payloads: drop them until the next sync
+        for source in sources:
+            source.secret.reset()
+    METRICS.observe("sync_seconds", time.monotonic() - start, phase="total")
+    METRICS.inc("sync_total", changed=str(changed).lower())
+    METRICS.set("last_sync_timestamp_seconds", time.time())
+    for source in sources:
+        for cache, stats in source.secret.cache_stats().items():
+            for name, value in stats.items():
+                METRICS.set(f"cache_{name}", value, cache=cache, source=source.name)
+        stats = source.secret.connection_stats()
+        if stats:
+            logger.info(f"Vault requests to {source.name}: {stats['requests']}, connections opened: {stats['connections']}, reused: {stats['reused']}")
+    return changed
+
+def plan(sources, entries) -> dict:
+    # Drift of the local copies, from Vault metadata only: nothing is installed
+    # As in sync, the first source installing a file wins
+    for source in sources:
+        source.secret.reset()
+    diff = {"add": [], "update": [], "stale": [], "unknown": []}
+    claimed = {}
+    unknown = set()
+    with METRICS.timer("sync_seconds", phase="plan"):
+        for path, base in entries:
+            for j, source in enumerate(sources):
+                ret = source.run(source.secret.plan_into(source.path(path), base))
+                for p,v in ret.items():
+                    if isinstance(v, dict):
+                        # Type in the secret data: its files can't be known from
+                        # metadata, nor reported stale
+                        diff["unknown"].append({"path": p, "version": v["version"]})
+                        unknown.add(v["path"])
+                        continue
+                    drift = v.plan()
+                    if claimed.setdefault(drift["file"], j) != j:
+                        continue
+                    status = drift.pop("status")
+                    if status != "current":
+                        drift["path"] = p
+                        diff[status].append(drift)
+        # State indexes are shared by all sources
+        diff["stale"] = sources[0].secret.stale(list(dict.fromkeys(base for path, base in entries)), set(claimed), unknown)
+    for v in diff.values():
+        v.sort(key=lambda d: (d.get("file") or "", d["path"] or ""))
+    return diff
+
+def write_metrics(args):
+    # Run summary for --metrics-file, cumulative over a daemon life
+    filepath = getattr(args, "metrics_file", None)
+    if filepath is None:
+        return
+    try:
+        METRICS.write(filepath, getattr(args, "metrics_format", "json"))
+    except OSError as e:
+        logger.error(f"Can't write metrics to {filepath} : {e!s}")
+
+def daemon(sources, entries, args):
+    # Keep the authenticated clients and their connections, resync on interval
+    # SIGHUP/SIGUSR1: resync now, SIGTERM/SIGINT: clean shutdown
+    wakeup = threading.Event()
+    stop = threading.Event()
+
+    def on_resync(signum, frame):
+        logger.info(f"Signal {signum}: resync")
+        wakeup.set()
+
+    def on_stop(signum, frame):
+        logger.info(f"Signal {signum}: shutdown")
+        stop.set()
+        wakeup.set()
+
+    for sig in (signal.SIGHUP, signal.SIGUSR1):
+        signal.signal(sig, on_resync)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, on_stop)
+
+    while not stop.is_set():
+        wakeup.clear()
+        try:
+            if sync(sources, entries):
+                logger.info("Secrets changed")
+        except Exception as e:
+            logger.error(f"Sync failed, retry at next interval: {e!s}")
+            METRICS.inc("sync_errors_total")
+        write_metrics(args)
+        next_sync = time.monotonic() + max(0, args.interval + random.uniform(-args.jitter, args.jitter))
+        while not stop.is_set() and not wakeup.is_set():
+            delay = next_sync - time.monotonic()
+            if delay <= 0:
+                break
+            # Wake up early to renew the tokens before they expire
+            renews = [source.secret.token_refresh_delay() for source in sources]
+            renew = min((r for r in renews if r is not None), default=None)
+            if renew is not None and renew < delay:
+                wakeup.wait(max(renew, 1))
+                for source in sources:
+                    try:
+                        source.run(source.secret._ensure_auth())
+                    except Exception as e:
+                        logger.error(f"Token renewal of {source.name} failed: {e!s}")
+            else:
+                wakeup.wait(delay)
+
 def main():
     parser = argparse.ArgumentParser(description='Process some integers.')
     
@@ -27,16 +236,37 @@ def main():
                          type=str, choices=['JSON', 'FILE', 'OBJECT', 'ENVVAR'], 
                          help='Type of config')
 
-    parser.add_argument('--secret-path', type=str, required=True, help='Path of the secret')
-    parser.add_argument('--localdir-secret', type=str, required=True, help='local directory to put secrets')
+    parser.add_argument('--secret-path', type=str, action='append', help='Path of the secret (repeatable)')
+    parser.add_argument('--localdir-secret', type=str, action='append', help='local directory to put secrets (repeatable, one per --secret-path)')
+    parser.add_argument('--manifest', type=str, help='JSON list of {"path": ..., "localdir": ...} to sync')
+
+    parser.add_argument('--daemon', action='store_true', help='keep running and resync periodically')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between two syncs in daemon mode')
+    parser.add_argument('--jitter', type=float, default=10, help='random +/- seconds added to the interval')
+
+    parser.add_argument('--plan', action='store_true',
+                        help='print as JSON the secrets to add, update or left stale, from metadata only, without installing anything')
+
+    parser.add_argument('--metrics-file', type=str, help='write counters and latency histograms to this file at exit (after each sync in daemon mode)')
+    parser.add_argument('--metrics-format', default="json", type=str, choices=['json', 'prometheus'],
+                         help='format of --metrics-file (prometheus: node_exporter textfile collector)')
 
     args = parser.parse_args()
+    if args.manifest is None and not args.secret_path:
+        parser.error("--secret-path/--localdir-secret or --manifest is required")
+    if args.plan and args.daemon:
+        parser.error("--plan can't be used with --daemon")
+    try:
+        args.entries = get_entries(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
 
     climain(args)
 
 def climain(args):
     if os.path.isfile(args.loggerconf):
-        logging.config.fileConfig(args.loggerconf, disable_existing_loggers=False)
+        from logging.config import fileConfig
+        fileConfig(args.loggerconf, disable_existing_loggers=False)
     else:
         # stdout handler
         stdhandler = logging.StreamHandler()
@@ -52,16 +282,27 @@ def climain(args):
     conf_loader = getattr(cfg, f"from_{args.config_type.lower()}")
     conf_loader(args.config)
 
-    if args.localdir_secret is not None:
-        cfg["SECRET_BASE_DIR"] = args.localdir_secret
+    entries = getattr(args, "entries", None) or get_entries(args)
+    if len(entries) == 1:
+        cfg["SECRET_BASE_DIR"] = entries[0][1]
 
-    secret=VaultSecret(config=cfg)
-    ret = secret.get(args.secret_path)
-    changed = False
-    for p,v in ret.items():
-        changed |= v.install()
+    # One client, loader and connection pool per source, shared by all entries
+    sources = get_sources(cfg)
+    try:
+        if getattr(args, "plan", False):
+            diff = plan(sources, entries)
+            print(json.dumps(diff, indent=2, sort_keys=True))
+            changed = any(diff[k] for k in ("add", "update", "stale"))
+        elif getattr(args, "daemon", False):
+            daemon(sources, entries, args)
+            changed = False
+        else:
+            changed = sync(sources, entries)
+    finally:
+        for source in sources:
+            source.close()
+        write_metrics(args)
 
     if changed:
         sys.exit(1)
     sys.exit(0)
-    
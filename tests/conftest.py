@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "benchmarks")]
+
+from fakevault import FakeVault, TOKEN
+from vault_secrets_getter.conf.config import Config
+
+
+@pytest.fixture
+def vault():
+    vault = FakeVault()
+    yield vault
+    vault.stop()
+
+
+@pytest.fixture
+def config(tmp_path):
+    # Config of one Vault, as loaded by climain: config(VAULT_ADDRESS=..., ...)
+    def make(**values):
+        values.setdefault("VAULT_TOKEN", TOKEN)
+        cfg = Config(str(tmp_path))
+        cfg.from_object(type("TestConfig", (), values))
+        return cfg
+    return make
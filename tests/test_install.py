@@ -0,0 +1,39 @@
+import os
+import stat
+
+from vault_secrets_getter.main import get_sources, sync
+
+
+def run_sync(cfg, entries):
+    sources = get_sources(cfg)
+    try:
+        return sync(sources, entries)
+    finally:
+        for source in sources:
+            source.close()
+
+
+def mode_of(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_without_perms_follows_umask(vault, config, tmp_path):
+    vault.put("app/env", {"A": "1"}, {"secretType": "envfile"})
+    cfg = config(VAULT_ADDRESS=vault.start())
+    umask = os.umask(0o022)
+    try:
+        assert run_sync(cfg, [("app", str(tmp_path))])
+    finally:
+        os.umask(umask)
+    assert mode_of(tmp_path / "env" / "env") == 0o644
+
+
+def test_changed_file_keeps_its_mode(vault, config, tmp_path):
+    vault.put("app/env", {"A": "1"}, {"secretType": "envfile"})
+    cfg = config(VAULT_ADDRESS=vault.start())
+    run_sync(cfg, [("app", str(tmp_path))])
+    os.chmod(tmp_path / "env" / "env", 0o640)
+    vault.put("app/env", {"A": "2"}, {"secretType": "envfile"}, version=2)
+    assert run_sync(cfg, [("app", str(tmp_path))])
+    assert (tmp_path / "env" / "env").read_text() == "A=2\n"
+    assert mode_of(tmp_path / "env" / "env") == 0o640
@@ -0,0 +1,21 @@
+from vault_secrets_getter.lib.metrics import METRICS
+from vault_secrets_getter.main import get_sources, sync
+
+
+def test_run_summary_has_requests_and_caches(vault, config, tmp_path):
+    vault.put("app/a", {"value": "YQ=="}, {"secretType": "base64", "secretFilename": "a"})
+    vault.put("app/b", {"link": "app/a"}, {"secretType": "alias"})
+    METRICS.reset()
+    sources = get_sources(config(VAULT_ADDRESS=vault.start()))
+    try:
+        sync(sources, [("app", str(tmp_path))])
+    finally:
+        for source in sources:
+            source.close()
+    snap = METRICS.snapshot()
+    ops = {h["labels"]["op"] for h in snap["histograms"] if h["name"] == "vault_request_seconds"}
+    assert {"list", "read"} <= ops
+    gauges = {(g["name"], g["labels"]["cache"]): g["value"] for g in snap["gauges"] if g["name"].startswith("cache_")}
+    # app/a is read once, then served to the alias from the run cache
+    assert gauges[("cache_hits", "run")] >= 1
+    assert ("cache_misses", "loader.LoaderFiltered.get_class") in gauges
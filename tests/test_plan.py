@@ -0,0 +1,29 @@
+from vault_secrets_getter.main import get_sources, plan, sync
+
+
+def run(fn, cfg, entries):
+    sources = get_sources(cfg)
+    try:
+        return fn(sources, entries)
+    finally:
+        for source in sources:
+            source.close()
+
+
+def test_secret_typed_in_data_is_unknown_not_stale(vault, config, tmp_path):
+    vault.put("root/a", {"secretType": "base64", "value": "YQ=="}, {"secretFilename": "a"})
+    vault.put("root/b", {"value": "Yg=="}, {"secretType": "base64", "secretFilename": "b"})
+    cfg = config(VAULT_ADDRESS=vault.start())
+    entries = [("root", str(tmp_path))]
+    assert run(sync, cfg, entries)
+    assert not run(sync, cfg, entries)
+
+    diff = run(plan, cfg, entries)
+    assert diff == {"add": [], "update": [], "stale": [],
+                    "unknown": [{"path": "root/a", "version": 1}]}
+
+    # Files of a secret removed from Vault are still stale
+    del vault.secrets["root/b"]
+    vault._index = None
+    diff = run(plan, cfg, entries)
+    assert [entry["path"] for entry in diff["stale"]] == ["root/b"]
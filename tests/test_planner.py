@@ -0,0 +1,57 @@
+import os
+import stat
+
+from vault_secrets_getter.SecretInstaller.planner import InstallPlanner
+
+
+class Installer:
+    # Sets the mode of path, as extraPerms of a secret do
+    def __init__(self, path, perms, fail=False):
+        self._path = path
+        self._secretFiles = {path: (None, None, perms, None)}
+        self.fail = fail
+        self.saved = False
+
+    def prepare(self, planner):
+        return True
+
+    def _install(self):
+        if self.fail:
+            raise RuntimeError("install failed")
+
+    def _saveVersion(self):
+        self.saved = True
+
+    def release(self):
+        pass
+
+
+def mode_of(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_streamed_installers_last_in_order_wins(tmp_path):
+    shared = tmp_path / "shared"
+    shared.touch()
+    first, last = Installer(str(shared), "0o640"), Installer(str(shared), "0o600")
+    planner = InstallPlanner()
+    # Streamed in the reverse order of the walk
+    assert planner.install(last, key="b")
+    assert mode_of(shared) == 0o600
+    assert planner.install(first, key="a")
+    assert planner.finish(["a", "b"])
+    assert mode_of(shared) == 0o600
+    assert first.saved and last.saved
+
+
+def test_batch_last_added_wins_and_failures_are_skipped(tmp_path):
+    shared = tmp_path / "shared"
+    shared.touch()
+    installers = [Installer(str(shared), "0o600"), Installer(str(shared), "0o640"),
+                  Installer(str(shared), "0o604", fail=True)]
+    planner = InstallPlanner()
+    for installer in installers:
+        planner.add(installer)
+    assert planner.execute()
+    assert mode_of(shared) == 0o640
+    assert [installer.saved for installer in installers] == [True, True, False]
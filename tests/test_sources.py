@@ -0,0 +1,82 @@
+import base64
+
+import httpx
+import hvac
+import pytest
+import requests
+
+from fakevault import FakeVault
+from vault_secrets_getter.main import get_sources, sync
+
+BACKENDS = [
+    pytest.param({"VAULT_BACKEND": "hvac"}, id="hvac"),
+    pytest.param({"VAULT_BACKEND": "async"}, id="async"),
+]
+
+
+class DenyingVault(FakeVault):
+    # One secret of the tree is forbidden: the walk fails
+    def route(self, method, url, token):
+        if url.split("?")[0].endswith("/app/s3"):
+            return 403, {"errors": ["permission denied"]}, {}
+        return super().route(method, url, token)
+
+
+def put(vault, names, value):
+    for n in names:
+        vault.put(f"app/s{n}", {"value": base64.b64encode(f"{value}{n}".encode()).decode()},
+                  {"secretType": "base64", "secretFilename": "value"})
+
+
+@pytest.fixture
+def vaults():
+    vaults = [FakeVault(latency_ms=2), FakeVault(latency_ms=2, mount="other")]
+    yield vaults
+    for vault in vaults:
+        vault.stop()
+
+
+def run(config, vaults, base, **options):
+    sources = get_sources(config(VAULT_SOURCES=[
+        {"VAULT_ADDRESS": vault.start(), "VAULT_SECRETS_MOUNTPOINT": vault.mount}
+        if isinstance(vault, FakeVault) else {"VAULT_ADDRESS": vault} for vault in vaults
+    ], **options))
+    try:
+        return sync(sources, [("app", str(base))])
+    finally:
+        for source in sources:
+            source.close()
+
+
+def installed(base, names):
+    return [(base / f"s{n}" / "value").read_text() for n in names]
+
+
+@pytest.mark.parametrize("buffer", [0, 2])
+@pytest.mark.parametrize("options", BACKENDS)
+def test_first_source_wins(vaults, config, tmp_path, options, buffer):
+    # With a small buffer, most installers of the second source are read again
+    put(vaults[0], range(10), "a")
+    put(vaults[1], range(5, 15), "b")
+    assert run(config, vaults, tmp_path, SECRET_PIPELINE_BUFFER=buffer, **options)
+    assert installed(tmp_path, range(10)) == [f"a{n}" for n in range(10)]
+    assert installed(tmp_path, range(10, 15)) == [f"b{n}" for n in range(10, 15)]
+
+
+@pytest.mark.parametrize("options", BACKENDS)
+def test_failed_source_installs_the_others(vaults, config, tmp_path, options):
+    vaults[0] = DenyingVault(latency_ms=2)
+    put(vaults[0], range(10), "a")
+    put(vaults[1], range(5, 15), "b")
+    with pytest.raises(hvac.exceptions.Forbidden):
+        run(config, vaults, tmp_path, SECRET_PIPELINE_BUFFER=2, **options)
+    assert installed(tmp_path, range(10, 15)) == [f"b{n}" for n in range(10, 15)]
+
+
+@pytest.mark.parametrize("options", BACKENDS)
+def test_unreachable_source_installs_the_others(vaults, config, tmp_path, options):
+    # Clients login on their first request, not when the sources are built
+    put(vaults[1], range(5), "b")
+    with pytest.raises((requests.ConnectionError, httpx.ConnectError)):
+        run(config, ["http://127.0.0.1:1", vaults[1]], tmp_path, VAULT_RETRIES=0, **options)
+    assert installed(tmp_path, range(5)) == [f"b{n}" for n in range(5)]
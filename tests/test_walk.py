@@ -0,0 +1,70 @@
+import asyncio
+
+import hvac
+import pytest
+
+from fakevault import FakeVault
+from tree import generate
+from vault_secrets_getter.main import get_sources
+
+WALKS = [
+    pytest.param({"VAULT_BACKEND": "hvac", "VAULT_CONCURRENCY": 1}, id="sequential"),
+    pytest.param({"VAULT_BACKEND": "hvac", "VAULT_CONCURRENCY": 8}, id="threaded"),
+    pytest.param({"VAULT_BACKEND": "async"}, id="async"),
+]
+
+
+def walk(cfg, path, base):
+    # Keys of get_into, as a sync would install them
+    source, = get_sources(cfg)
+    try:
+        return list(source.run(source.secret.get_into(source.path(path), base)))
+    finally:
+        source.close()
+
+
+@pytest.fixture
+def tree(vault):
+    generate(vault, root="app", width=3, depth=2, alias_density=0.3,
+             mix="base64:2,envfile:1,x509:1", seed=7)
+    return vault.start()
+
+
+@pytest.mark.parametrize("options", WALKS)
+def test_walks_find_the_same_keys(tree, config, tmp_path, options):
+    expected = walk(config(VAULT_ADDRESS=tree), "app", str(tmp_path / "ref"))
+    assert len(expected) == 27
+    assert any(">>" in key for key in expected)
+    assert walk(config(VAULT_ADDRESS=tree, **options), "app", str(tmp_path / "out")) == expected
+
+
+@pytest.mark.parametrize("options", WALKS)
+def test_alias_cycle_stops(vault, config, tmp_path, options):
+    vault.put("app/a", {"link": "app-links/b"}, {"secretType": "alias"})
+    vault.put("app-links/b", {"link": "app/a"}, {"secretType": "alias"})
+    vault.put("app/c", {"value": "YQ=="}, {"secretType": "base64", "secretFilename": "c"})
+    url = vault.start()
+    assert walk(config(VAULT_ADDRESS=url, **options), "app", str(tmp_path)) == ["app/c"]
+
+
+class DenyingVault(FakeVault):
+    # One leaf of the tree is forbidden
+    def route(self, method, url, token):
+        if "/data/app/d0/d1/s1" in url:
+            return 403, {"errors": ["permission denied"]}, {}
+        return super().route(method, url, token)
+
+
+def test_failed_async_walk_leaves_no_task(config, tmp_path):
+    vault = DenyingVault(latency_ms=5)
+    generate(vault, root="app", width=3, depth=2, seed=7)
+    try:
+        source, = get_sources(config(VAULT_ADDRESS=vault.start(), VAULT_BACKEND="async"))
+        try:
+            with pytest.raises(hvac.exceptions.Forbidden):
+                source.run(source.secret.get_into("app", str(tmp_path)))
+            assert [task for task in asyncio.all_tasks(source.loop) if not task.done()] == []
+        finally:
+            source.close()
+    finally:
+        vault.stop()